@@ -0,0 +1,181 @@
+import random
+import solver
+from instance import as_numpy
+from state import BusState
+from moves import Swap
+
+def _gather(offsets, s, np):
+    '''
+        Flattens the CSR rows of the students s: returns (seg, pos) where pos runs
+        over every row's entries and seg[j] is the index in s of the row pos[j] is in
+    '''
+    start, deg = offsets[s], offsets[s + 1] - offsets[s]
+    seg = np.repeat(np.arange(len(s)), deg)
+    pos = np.arange(len(seg)) - np.repeat(np.cumsum(deg) - deg, deg) + np.repeat(start, deg)
+    return seg, pos
+
+class GroupArrays:
+    '''
+        The group histograms of a BusState as NumPy arrays, like kernel.KernelState's,
+        for the rowdy groups that can flip: those of two or more students that fit on
+        one bus. Groups are renumbered in that order.
+            offsets, groups - CSR lists of each student's groups
+            keys - sorted student * num_groups + group for every membership
+            hist - hist[g, b] is the number of members of g on bus b
+            spread - spread[g] is the number of buses g is spread over
+    '''
+    def __init__(self, state, size_bus, np):
+        self.np = np
+        small = [g for g, group in enumerate(state.groups) if 1 < len(group) <= size_bus]
+        renumber = {g: i for i, g in enumerate(small)}
+        mine = [[renumber[g] for g in groups if g in renumber] for groups in state.groups_of]
+        self.offsets = np.zeros(len(mine) + 1, dtype=np.intp)
+        self.offsets[1:] = np.cumsum([len(m) for m in mine])
+        self.groups = np.array([g for m in mine for g in m], dtype=np.intp)
+        self.count = len(small)
+        self.keys = np.sort(np.repeat(np.arange(len(mine)), np.diff(self.offsets)) * self.count
+                            + self.groups)
+        self.hist = np.zeros((len(small), len(state.members)), dtype=np.intc)
+        for i, g in enumerate(small):
+            for b, c in state.hist[g].items():
+                self.hist[i, b] = c
+        self.spread = (self.hist > 0).sum(axis=1)
+
+    def flips(self, a, b, A, B):
+        '''
+            A bool array, True for each swap of a[i] (on bus A[i]) with b[i] (on bus
+            B[i]) that makes a group intact or breaks one up. Groups both students are
+            in keep their histogram, so they are skipped.
+        '''
+        np = self.np
+        flipped = np.zeros(len(a), dtype=bool)
+        if not self.count:
+            return flipped
+        for s, other, src, dst in ((a, b, A, B), (b, a, B, A)):
+            seg, pos = _gather(self.offsets, s, np)
+            g = self.groups[pos]
+            key = other[seg] * self.count + g
+            at = np.minimum(np.searchsorted(self.keys, key), len(self.keys) - 1)
+            shared = self.keys[at] == key
+            spread = self.spread[g]
+            after = spread - (self.hist[g, src[seg]] == 1) + (self.hist[g, dst[seg]] == 0)
+            flip = ((spread == 1) != (after == 1)) & ~shared
+            flipped[seg[flip]] = True
+        return flipped
+
+    def move(self, s, src, dst):
+        # moves student s from bus src to dst in the histograms
+        g = self.groups[self.offsets[s]:self.offsets[s + 1]]
+        if len(g):
+            self.hist[g, src] -= 1
+            self.hist[g, dst] += 1
+            self.spread[g] = (self.hist[g] > 0).sum(axis=1)
+
+def swap_batch(instance, state, a, b, groups, np):
+    '''
+        Scores swapping a[i] with b[i] for a whole batch against the scorer's objective
+
+        A swap that flips no rowdy group only changes which friendships are on the
+        same bus, so its change in kept is a count over the two neighbourhoods, done
+        for the whole batch with gathers over the CSR adjacency. Which swaps flip a
+        group is found the same way from groups' histograms, and only those are
+        scored exactly by state.swap_delta.
+
+        Inputs:
+            a, b - int arrays of students on different buses
+            groups - the state's GroupArrays
+
+        Outputs:
+            an int array of the change in kept for each swap
+    '''
+    offsets, adj = as_numpy(instance.adj_offsets), as_numpy(instance.adj)
+    bus_of, intact = as_numpy(state.bus_of), as_numpy(state.intact)
+    A, B = bus_of[a], bus_of[b]
+    m = len(a)
+
+    def side(s, src, dst, other):
+        # kept friends of s on dst minus those on src, over s's whole neighbourhood;
+        # a student in an intact group keeps none either way
+        seg, pos = _gather(offsets, s, np)
+        nb = adj[pos]
+        free = intact[nb] == 0
+        where = bus_of[nb]
+        gain = np.bincount(seg, weights=free & (where == dst[seg]), minlength=m)
+        loss = np.bincount(seg, weights=free & (where == src[seg]), minlength=m)
+        # the other student is counted on dst, but it moves the other way
+        both = np.bincount(seg, weights=free & (nb == other[seg]), minlength=m)
+        return (gain - loss - both) * (intact[s] == 0)
+
+    d_kept = (side(a, A, B, b) + side(b, B, A, a)).astype(np.intc)
+    for i in np.flatnonzero(groups.flips(a, b, A, B)):
+        d_kept[i] = state.swap_delta(int(a[i]), int(b[i]))[2]
+    return d_kept
+
+def batch_anneal(instance, buses, deadline=None, checkpoint=None, size=256, rng=random):
+    '''
+        Annealing on the scorer's objective that proposes size swaps at a time. The whole
+        batch is scored with swap_batch and put through one vectorised Metropolis test,
+        then accepted swaps are applied in order as long as no earlier swap in the batch
+        touched either of their buses, which keeps every applied delta exact.
+
+        Inputs:
+            instance - the ProblemInstance
+            buses - the starting solution, as lists of student indices
+            deadline - optional time.time() value to finish by; solver.run_schedule
+                fits the cooling rate to the measured batches per second
+            checkpoint - optional callable given the best solution so far, as for solver.anneal
+            size - swaps per batch
+            rng - the run's generator, which seeds the batch sampler
+
+        Outputs:
+            the best solution seen, as lists of student indices
+    '''
+    if instance.num_buses < 2:
+        # no swap can change anything
+        return [list(bus) for bus in buses]
+    import numpy as np
+    sampler = np.random.default_rng(rng.getrandbits(32))
+    state = BusState(instance, buses)
+    n = instance.num_students
+    groups = GroupArrays(state, instance.size_bus, np)
+    bus_of = as_numpy(state.bus_of)
+
+    best = state.kept
+    min_sol = state.snapshot()
+
+    def step(T):
+        # one batch per temperature step; costs are -kept as in solver.anneal
+        nonlocal best, min_sol
+        a = sampler.integers(0, n, size)
+        b = sampler.integers(0, n, size)
+        keep = bus_of[a] != bus_of[b]
+        a, b = a[keep], b[keep]
+        cost = -swap_batch(instance, state, a, b, groups, np)
+        # min() keeps exp() from overflowing on big improvements
+        accept = sampler.random(len(a)) < np.exp(np.minimum(-cost / T, 0))
+
+        used = set()
+        for i in np.flatnonzero(accept):
+            A, B = int(bus_of[a[i]]), int(bus_of[b[i]])
+            if A in used or B in used:
+                continue
+            used.add(A)
+            used.add(B)
+            Swap(int(a[i]), int(b[i])).apply(state)
+            groups.move(a[i], A, B)
+            groups.move(b[i], B, A)
+        if state.kept > best:
+            best = state.kept
+            min_sol = state.snapshot()
+        return -best
+
+    solver.run_schedule(step, -best, lambda: state.buses_from(min_sol), deadline,
+                        checkpoint=checkpoint)
+    return state.buses_from(min_sol)
+
+def batch_score_anneal(instance, deadline=None, checkpoint=None, rng=random):
+    '''
+        score_anneal with the annealing done by batch_anneal
+    '''
+    return solver.refine_anneal(instance, solver.greedy(instance), deadline, checkpoint,
+                                annealer=batch_anneal, rng=rng)
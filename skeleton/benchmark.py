@@ -0,0 +1,192 @@
+import sys
+import time
+import argparse
+import subprocess
+
+####################################################
+# To run:
+#   python3 benchmark.py <benchmark> [options]
+#
+# Benchmarks:
+#   startup - interpreter start plus `import <module>` for the solver and scorer
+#             modules, compared against a bare interpreter. Each is timed as the
+#             fastest of --runs interleaved starts, since noise only adds time.
+#             Fails if importing a module pulls in NetworkX, matplotlib or Numba,
+#             or adds more than --max-ratio times the bare interpreter's start.
+#   greedy  - time to build greedy()'s starting solution for each input, with the
+#             students in edge order, next to the old list-scan ordering.
+#   kernel  - anneal() on the scorer's objective for a fixed number of temperature
+#             steps from greedy's solution, in pure Python and in kernel.py's
+#             compiled kernel: moves per second and the score each reaches.
+#
+# Examples:
+#   python3 benchmark.py startup
+#   python3 benchmark.py startup --runs 40 --max-ratio 1.5
+#   python3 benchmark.py greedy large --ids 1000-1010
+#   python3 benchmark.py kernel medium --ids 1-10 --steps 200
+####################################################
+
+# modules that should only be imported when their features are actually used
+heavy_modules = ["networkx", "matplotlib", "numba"]
+
+def time_commands(codes, runs):
+    '''
+        Returns the fastest wall-clock time in ms of runs runs of `python -c code` for
+        each of codes. The runs are interleaved, so a slow spell on the machine hits
+        every command alike instead of whichever happened to be running.
+    '''
+    best = [None] * len(codes)
+    for _ in range(runs):
+        for i, code in enumerate(codes):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True)
+            t = (time.perf_counter() - start) * 1000
+            best[i] = t if best[i] is None else min(best[i], t)
+    return best
+
+def startup(args):
+    times = time_commands(["pass"] + ["import " + module for module in args.modules], args.runs)
+    baseline = times[0]
+    print("bare interpreter: {:.1f} ms".format(baseline))
+    failed = False
+    for module, t in zip(args.modules, times[1:]):
+        check = ("import sys, {0}\n"
+                 "heavy = [m for m in {1!r} if m in sys.modules]\n"
+                 "sys.exit('imports ' + ', '.join(heavy) if heavy else 0)").format(module, heavy_modules)
+        result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True)
+        overhead = t - baseline
+        status = "ok"
+        if result.returncode != 0:
+            status = result.stderr.strip().splitlines()[-1]
+            failed = True
+        elif overhead > args.max_ratio * baseline:
+            status = "over budget of {:.1f} ms".format(args.max_ratio * baseline)
+            failed = True
+        print("import {}: +{:.1f} ms {}".format(module, overhead, status))
+    return 1 if failed else 0
+
+def list_scan_order(instance):
+    '''
+        The ordering greedy() used to build, with a list scan per edge endpoint
+    '''
+    students = []
+    for e in instance.edges():
+        if e[0] not in students:
+            students.append(e[0])
+        if e[1] not in students:
+            students.append(e[1])
+    for s in range(instance.num_students):
+        if s not in students:
+            students.append(s)
+    return students
+
+def best_time(f, runs):
+    '''
+        Returns the fastest of runs calls of f, in ms
+    '''
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        f()
+        t = (time.perf_counter() - start) * 1000
+        best = t if best is None else min(best, t)
+    return best
+
+def greedy(args):
+    import solver
+    from instance import load_instance
+    from scorer_many import parse_ids, list_inputs
+    inputs = list_inputs(args.size, parse_ids(args.ids) if args.ids else None, solver.path_to_inputs)
+    total = old_total = 0
+    for i, folder in inputs:
+        instance = load_instance(folder)
+        t = best_time(lambda: solver.greedy(instance), args.runs)
+        line = "{}/{}: {} students, {} edges, greedy {:.2f} ms".format(
+            args.size, i, instance.num_students, instance.num_edges, t)
+        total += t
+        if not args.no_reference:
+            old = best_time(lambda: list_scan_order(instance), 1)
+            assert list_scan_order(instance) == solver.edge_order(instance)
+            line += ", list scan {:.1f} ms".format(old)
+            old_total += old
+        print(line)
+    print("total: greedy {:.1f} ms{}".format(
+        total, "" if args.no_reference else ", list scan {:.1f} ms".format(old_total)))
+    return 0
+
+def timed_anneal(solver, instance, start, steps, seed):
+    '''
+        Runs anneal on get_score for steps temperature steps of 500 moves
+
+        Outputs:
+            (seconds, score) with the score as output_scorer gives it
+    '''
+    import random
+    import itertools
+    from output_scorer import score_assignments
+    count = itertools.count()
+    t = time.perf_counter()
+    sol = solver.anneal(instance, start, solver.get_score, stop=lambda best: next(count) >= steps,
+                        rng=random.Random(seed))
+    t = time.perf_counter() - t
+    names = instance.names
+    return t, score_assignments(instance, [[names[s] for s in bus] for bus in sol])[0]
+
+def kernel(args):
+    import solver
+    import kernel
+    from instance import load_instance
+    from scorer_many import parse_ids, list_inputs
+    if not kernel.available:
+        print("numba is not installed; only the pure-Python loop can run")
+        return 1
+    kernel.warm()
+    inputs = list_inputs(args.size, parse_ids(args.ids) if args.ids else None, solver.path_to_inputs)
+    moves = 500 * args.steps
+    total = {False: 0.0, True: 0.0}
+    for i, folder in inputs:
+        instance = load_instance(folder)
+        start = solver.greedy(instance)
+        line = "{}/{}:".format(args.size, i)
+        for compiled in (False, True):
+            solver.use_kernel = compiled
+            seconds, score = timed_anneal(solver, instance, start, args.steps, args.seed)
+            total[compiled] += seconds
+            line += " {} {:.0f} moves/s score {:.4f}".format(
+                "kernel" if compiled else "python", moves / seconds, score)
+        print(line)
+    solver.use_kernel = True
+    print("total: python {:.2f} s, kernel {:.2f} s, {:.1f}x".format(
+        total[False], total[True], total[False] / max(total[True], 1e-9)))
+    return 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Solver and scorer benchmarks")
+    commands = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = commands.add_parser("startup", help="module import time")
+    p.add_argument("--runs", type=int, default=20)
+    p.add_argument("--max-ratio", type=float, default=3.0,
+                   help="budget per import, as a multiple of the bare interpreter's start")
+    p.add_argument("--modules", nargs="+", default=["output_scorer", "solver", "scorer_many", "instance"])
+    p.set_defaults(run=startup)
+
+    p = commands.add_parser("greedy", help="greedy() starting solution construction")
+    p.add_argument("size", choices=["small", "medium", "large"])
+    p.add_argument("--ids", nargs="+")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--no-reference", action="store_true", help="skip timing the old list scan")
+    p.set_defaults(run=greedy)
+
+    p = commands.add_parser("kernel", help="anneal() in Python against the compiled kernel")
+    p.add_argument("size", choices=["small", "medium", "large"])
+    p.add_argument("--ids", nargs="+")
+    p.add_argument("--steps", type=int, default=100, help="temperature steps of 500 moves")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(run=kernel)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,116 @@
+import random
+import solver
+
+def label_propagation(instance, rounds=20, rng=random):
+    '''
+        Asynchronous label propagation: every student starts in its own community and
+        repeatedly adopts the label most of its friends have, ties broken at random,
+        until a round changes nothing
+
+        Outputs:
+            a list of communities, each a list of student indices
+    '''
+    n = instance.num_students
+    nbrs = [instance.neighbors(s).tolist() for s in range(n)]
+    label = list(range(n))
+    order = list(range(n))
+    for _ in range(rounds):
+        rng.shuffle(order)
+        changed = False
+        for s in order:
+            if not nbrs[s]:
+                continue
+            count = {}
+            for x in nbrs[s]:
+                count[label[x]] = count.get(label[x], 0) + 1
+            top = max(count.values())
+            if count.get(label[s], 0) == top:
+                continue
+            label[s] = rng.choice([l for l, c in count.items() if c == top])
+            changed = True
+        if not changed:
+            break
+
+    members = {}
+    for s in range(n):
+        members.setdefault(label[s], []).append(s)
+    return list(members.values())
+
+def grow(community, nbrs, size):
+    '''
+        Takes a piece of at most size students off a community by growing it from
+        its best-connected student, always adding the student with the most friends
+        already in the piece, so the piece is cut off along a weak boundary
+
+        Outputs:
+            (piece, rest)
+    '''
+    inside = set(community)
+    seed = max(community, key=lambda s: sum(1 for x in nbrs[s] if x in inside))
+    piece = [seed]
+    taken = {seed}
+    links = {}
+    for x in nbrs[seed]:
+        if x in inside:
+            links[x] = links.get(x, 0) + 1
+    while len(piece) < size and len(taken) < len(inside):
+        if links:
+            s = max(links, key=links.get)
+            del links[s]
+        else:
+            # the rest isn't connected to the piece; start again anywhere
+            s = next(x for x in community if x not in taken)
+        piece.append(s)
+        taken.add(s)
+        for x in nbrs[s]:
+            if x in inside and x not in taken:
+                links[x] = links.get(x, 0) + 1
+    return piece, [s for s in community if s not in taken]
+
+def community_seed(instance, rng=random):
+    '''
+        A starting solution from communities in the friendship graph: communities bigger
+        than a bus are split along weak cuts, then packed into buses largest first,
+        each into the emptiest bus it fits on. A piece that fits nowhere is split to
+        fill the roomiest bus, and empty buses take a piece off the fullest one.
+
+        Outputs:
+            a solution as lists of student indices
+    '''
+    num_buses, size_bus = instance.num_buses, instance.size_bus
+    nbrs = [instance.neighbors(s).tolist() for s in range(instance.num_students)]
+
+    pieces = []
+    for community in label_propagation(instance, rng=rng):
+        while len(community) > size_bus:
+            piece, community = grow(community, nbrs, size_bus)
+            pieces.append(piece)
+        pieces.append(community)
+    pieces.sort(key=len)
+
+    buses = [[] for _ in range(num_buses)]
+    while pieces:
+        piece = pieces.pop()
+        room = [size_bus - len(bus) for bus in buses]
+        fits = [b for b in range(num_buses) if room[b] >= len(piece)]
+        if fits:
+            buses[min(fits, key=lambda b: len(buses[b]))].extend(piece)
+            continue
+        b = max(range(num_buses), key=room.__getitem__)
+        part, rest = grow(piece, nbrs, room[b])
+        buses[b].extend(part)
+        pieces.append(rest)
+        pieces.sort(key=len)
+
+    for b in range(num_buses):
+        if not buses[b]:
+            full = max(range(num_buses), key=lambda c: len(buses[c]))
+            part, buses[full] = grow(buses[full], nbrs, len(buses[full]) // 2)
+            buses[b] = part
+    return buses
+
+def community_anneal(instance, deadline=None, checkpoint=None, rng=random):
+    '''
+        score_anneal started from community_seed instead of greedy
+    '''
+    return solver.refine_anneal(instance, community_seed(instance, rng), deadline, checkpoint, rng=rng)
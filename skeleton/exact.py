@@ -0,0 +1,242 @@
+import time
+import random
+import solver
+
+# nodes branch_and_bound may search before exact_anneal falls back to annealing. A
+# count rather than seconds, so a run without a time limit repeats exactly; most
+# inputs it can prove at all take a few hundred nodes
+exact_nodes = 2500
+
+# fraction of a time limit branch_and_bound may search before falling back; most
+# inputs it can prove at all are proven in a fraction of a second
+exact_share = 0.05
+
+def kept_of(instance, nbrs, bus_of):
+    '''
+        The scorer's numerator for a complete assignment: same-bus friendships
+        (self-loops included) where neither student is in an intact rowdy group
+    '''
+    removed = bytearray(instance.num_students)
+    for g in range(instance.num_groups):
+        group = instance.group(g)
+        b = bus_of[group[0]]
+        if all(bus_of[s] == b for s in group):
+            for s in group:
+                removed[s] = 1
+    kept = sum(1 for u, v in instance.edges() if u == v and not removed[u])
+    for s, friends in enumerate(nbrs):
+        if not removed[s]:
+            kept += sum(1 for x in friends if x > s and not removed[x] and bus_of[x] == bus_of[s])
+    return kept
+
+def search_order(nbrs):
+    '''
+        Students breadth first from the best-connected one, so each student is placed
+        while its friends are being placed and the bound tightens early
+    '''
+    n = len(nbrs)
+    seen = bytearray(n)
+    order = []
+    for root in sorted(range(n), key=lambda s: -len(nbrs[s])):
+        if seen[root]:
+            continue
+        seen[root] = 1
+        queue = [root]
+        for s in queue:
+            order.append(s)
+            for x in sorted(nbrs[s], key=lambda x: -len(nbrs[x])):
+                if not seen[x]:
+                    seen[x] = 1
+                    queue.append(x)
+    return order
+
+def branch_and_bound(instance, incumbent, deadline=None, max_nodes=None):
+    '''
+        Exact depth-first branch and bound on the scorer's objective. Students are
+        placed one at a time; a student may only open the lowest-numbered empty bus
+        (buses are interchangeable), full buses are skipped, and a branch that leaves
+        more empty buses than unplaced students is cut. The bound is the same-bus
+        friendships so far plus, for each unplaced student, its placed friends on its
+        best bus with room and half its unplaced friends, at most size_bus - 1 friends;
+        rowdy groups only lower the score, so they are counted exactly at the leaves.
+        Each unplaced student's best-bus count and the bound's sums are updated as
+        students are placed, so a node costs the placed student's neighbourhood
+        rather than a pass over every unplaced student and bus. The search keeps its
+        own stack, so it doesn't recurse once per student.
+
+        Inputs:
+            instance - the ProblemInstance
+            incumbent - a solution as lists of student indices to start from
+            deadline - optional time.time() value to give up at, checked at every node
+            max_nodes - optional number of nodes to give up after
+
+        Outputs:
+            (solution, proven) - the best solution found as lists of student indices,
+            and whether it was proven optimal before the deadline or node limit
+    '''
+    n, k, cap = instance.num_students, instance.num_buses, instance.size_bus
+    nbrs = [instance.neighbors(s).tolist() for s in range(n)]
+    friends = [sorted(set(f) - {s}) for s, f in enumerate(nbrs)]
+    loops = sum(1 for u, v in instance.edges() if u == v)
+    order = search_order(nbrs)
+
+    best_bus = [0] * n
+    for b, bus in enumerate(incumbent):
+        for s in bus:
+            best_bus[s] = b
+    best_kept = kept_of(instance, nbrs, best_bus)
+
+    bus_of = [-1] * n
+    load = [0] * k
+    on = [[] for _ in range(k)]
+    conn = [[0] * k for _ in range(n)]
+    # the most friendships a student can keep: its cap - 1 friends it has most edges with
+    limit = []
+    for f in nbrs:
+        count = {}
+        for x in f:
+            count[x] = count.get(x, 0) + 1
+        limit.append(sum(sorted(count.values(), reverse=True)[:cap - 1]))
+    # unplaced friends of each student, and its placed friends on its best bus with room
+    open_nbrs = [len(f) for f in nbrs]
+    top = [0] * n
+    # (student, old top) pairs to restore on backtracking
+    trail = []
+    # same-bus friendships so far, friendships between unplaced students, and the
+    # bound's two sums over unplaced students
+    same = 0
+    free = sum(open_nbrs) // 2
+    placed_sum = 0
+    half_sum = sum(min(open_nbrs[v], limit[v]) for v in range(n))
+
+    def terms(v):
+        # v's share of the bound: first its placed friends on the best bus with room,
+        # then unplaced friends, each shared with the other end
+        placed = min(top[v], limit[v])
+        return placed, min(open_nbrs[v], limit[v] - placed)
+
+    def bound():
+        return loops + same + placed_sum + min(free, half_sum // 2)
+
+    def place(v, b):
+        # places v on b; returns what unplace needs to undo it
+        nonlocal same, free, placed_sum, half_sum
+        saved = same, free, placed_sum, half_sum, len(trail)
+        fills = load[b] + 1 == cap
+        affected = {x for x in friends[v] if bus_of[x] == -1}
+        if fills:
+            # b stops counting as a bus with room for everyone with friends on it
+            affected.update(x for y in on[b] for x in friends[y] if bus_of[x] == -1)
+            affected.discard(v)
+        for x in (v, *affected):
+            placed, half = terms(x)
+            placed_sum -= placed
+            half_sum -= half
+
+        bus_of[v] = b
+        load[b] += 1
+        on[b].append(v)
+        same += conn[v][b]
+        for x in nbrs[v]:
+            conn[x][b] += 1
+            open_nbrs[x] -= 1
+            if bus_of[x] == -1:
+                free -= 1
+
+        for x in affected:
+            if fills:
+                row = conn[x]
+                new = max([row[c] for c in range(k) if load[c] < cap], default=0)
+            else:
+                new = max(top[x], conn[x][b])
+            if new != top[x]:
+                trail.append((x, top[x]))
+                top[x] = new
+            placed, half = terms(x)
+            placed_sum += placed
+            half_sum += half
+        return saved
+
+    def unplace(v, b, saved):
+        nonlocal same, free, placed_sum, half_sum
+        for x in nbrs[v]:
+            conn[x][b] -= 1
+            open_nbrs[x] += 1
+        bus_of[v] = -1
+        load[b] -= 1
+        on[b].pop()
+        same, free, placed_sum, half_sum, mark = saved
+        while len(trail) > mark:
+            x, old = trail.pop()
+            top[x] = old
+
+    def options(i, used):
+        # buses order[i] may go on, most placed friends first
+        v = order[i]
+        remaining = n - i - 1
+        buses = [b for b in range(min(used + 1, k))
+                 if load[b] < cap and k - max(used, b + 1) <= remaining]
+        buses.sort(key=lambda b: -conn[v][b])
+        return buses
+
+    # one frame per placed student: [its options, next option, buses used before it,
+    # (bus, saved) while it is placed]
+    stack = []
+    i, used = 0, 0
+    nodes = 0
+    proven = True
+    while True:
+        nodes += 1
+        if ((deadline is not None and time.time() >= deadline)
+                or (max_nodes is not None and nodes > max_nodes)):
+            proven = False
+            break
+        if i == n:
+            kept = kept_of(instance, nbrs, bus_of)
+            if kept > best_kept:
+                best_kept, best_bus = kept, bus_of[:]
+        elif bound() > best_kept:
+            stack.append([options(i, used), 0, used, None])
+
+        # on to the next untried option of the deepest student that has one
+        while stack:
+            frame = stack[-1]
+            v = order[len(stack) - 1]
+            if frame[3] is not None:
+                unplace(v, *frame[3])
+                frame[3] = None
+                if bound() <= best_kept:
+                    stack.pop()
+                    continue
+            if frame[1] == len(frame[0]):
+                stack.pop()
+                continue
+            b = frame[0][frame[1]]
+            frame[1] += 1
+            frame[3] = b, place(v, b)
+            i, used = len(stack), max(frame[2], b + 1)
+            break
+        else:
+            break
+
+    buses = [[] for _ in range(k)]
+    for s, b in enumerate(best_bus):
+        buses[b].append(s)
+    return buses, proven
+
+def exact_anneal(instance, deadline=None, checkpoint=None, rng=random):
+    '''
+        Branch and bound from an FM-refined greedy start for up to exact_nodes nodes
+        and exact_share of the budget; if it can't prove optimality in that time its
+        best solution goes on to refine_anneal for the rest. Inputs of more than
+        solver.exact_threshold students go straight to score_anneal.
+    '''
+    from refine import fm_refine
+    if instance.num_students > solver.exact_threshold:
+        return solver.score_anneal(instance, deadline, checkpoint, rng)
+    until = None if deadline is None else time.time() + exact_share * (deadline - time.time())
+    start = fm_refine(instance, solver.greedy(instance), deadline=until)
+    sol, proven = branch_and_bound(instance, start, until, exact_nodes)
+    if proven:
+        return sol
+    return solver.refine_anneal(instance, sol, deadline, checkpoint, rng=rng)
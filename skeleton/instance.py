@@ -0,0 +1,376 @@
+import os
+import re
+import sys
+import struct
+from array import array
+
+###########################################
+# Compiled instances are cached here, keyed
+# by a hash of graph.gml and parameters.txt.
+# Set to None to always parse the text files
+###########################################
+path_to_cache = "../.instance_cache"
+
+class ProblemInstance:
+    '''
+        Compact, integer-indexed form of an input shared by the solver and the scorer.
+
+        Students are relabelled to dense ints 0..n-1 in graph node order and names are
+        only kept to translate back when writing or validating outputs.
+
+        Attributes:
+            names - index -> student name
+            index - student name -> index
+            num_buses, size_bus - the bus parameters
+            edge_u, edge_v - endpoints of every edge, in graph.edges() order
+            adj_offsets, adj - CSR adjacency; the neighbours of s are
+                adj[adj_offsets[s]:adj_offsets[s + 1]], self-loops excluded
+            self_loops - number of self-loop edges
+            group_offsets, group_members - the rowdy groups as one flat index array,
+                group g is group_members[group_offsets[g]:group_offsets[g + 1]]
+            student_group_offsets, student_groups - CSR of the groups each student is in
+            path - the compiled file the instance is mapped from, or None
+
+        The index arrays are array('i') when parsed and int32 memoryviews when mapped
+        from the cache; both index, slice and iterate the same way.
+    '''
+    def __init__(self, names, edges, num_buses, size_bus, constraints):
+        '''
+            Inputs:
+                names - a list of student names, in node order
+                edges - an iterable of (u, v) index pairs
+                num_buses - an integer representing the number of buses
+                size_bus - an integer representing the capacity of each bus
+                constraints - a list of rowdy groups, each a list of indices
+        '''
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.path = None
+        self.num_buses = num_buses
+        self.size_bus = size_bus
+        n = len(names)
+
+        self.edge_u = array('i')
+        self.edge_v = array('i')
+        degree = [0] * n
+        for u, v in edges:
+            self.edge_u.append(u)
+            self.edge_v.append(v)
+            if u != v:
+                degree[u] += 1
+                degree[v] += 1
+        self.self_loops = sum(1 for u, v in zip(self.edge_u, self.edge_v) if u == v)
+        self.adj_offsets, self.adj = _csr(degree, (
+            pair for u, v in zip(self.edge_u, self.edge_v) if u != v
+            for pair in ((u, v), (v, u))))
+
+        self.group_offsets = array('i', [0])
+        self.group_members = array('i')
+        sizes = [0] * n
+        for c in constraints:
+            self.group_members.extend(c)
+            self.group_offsets.append(len(self.group_members))
+            for s in c:
+                sizes[s] += 1
+        self.student_group_offsets, self.student_groups = _csr(sizes, (
+            (s, g) for g, c in enumerate(constraints) for s in c))
+
+    def __reduce_ex__(self, protocol):
+        # mmap-backed instances are sent to worker processes as their cache path
+        # and mapped again there instead of being copied through the pipe
+        if self.path is not None:
+            return load_compiled, (self.path,)
+        return super().__reduce_ex__(protocol)
+
+    @classmethod
+    def from_graph(cls, graph, num_buses, size_bus, constraints):
+        '''
+            Builds an instance from the values returned by solver.parse_input
+        '''
+        names = list(graph.nodes())
+        index = {name: i for i, name in enumerate(names)}
+        edges = ((index[u], index[v]) for u, v in graph.edges())
+        groups = [[index[s] for s in c] for c in constraints]
+        return cls(names, edges, num_buses, size_bus, groups)
+
+    @property
+    def num_students(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_u)
+
+    @property
+    def num_groups(self):
+        return len(self.group_offsets) - 1
+
+    def neighbors(self, s):
+        return self.adj[self.adj_offsets[s]:self.adj_offsets[s + 1]]
+
+    def group(self, g):
+        return self.group_members[self.group_offsets[g]:self.group_offsets[g + 1]]
+
+    def groups_of(self, s):
+        return self.student_groups[self.student_group_offsets[s]:self.student_group_offsets[s + 1]]
+
+    def edges(self):
+        return zip(self.edge_u, self.edge_v)
+
+def _csr(counts, pairs):
+    # counting sort of (row, value) pairs into offsets/values arrays
+    offsets = array('i', [0])
+    for c in counts:
+        offsets.append(offsets[-1] + c)
+    values = array('i', [0]) * offsets[-1]
+    fill = array('i', offsets[:-1])
+    for row, value in pairs:
+        values[fill[row]] = value
+        fill[row] += 1
+    return offsets, values
+
+def as_numpy(values):
+    '''
+        Zero-copy NumPy view of one of the instance's array('i') buffers
+    '''
+    import numpy as np
+    return np.frombuffer(values, dtype=np.intc)
+
+# GML tokens: quoted strings (which may contain brackets), list brackets, bare words
+_gml_token = re.compile(r'"[^"]*"|\[|\]|[^\s\[\]"]+')
+
+def read_graph(folder_name):
+    '''
+        Single-pass parser for the graph.gml files produced by NetworkX: nodes with an
+        id and a label, and undirected edges with a source and a target. Every other
+        key, and any nested list such as graphics, is skipped.
+
+        Outputs:
+            (names, edges)
+            names - node labels in file order, as nx.read_gml would key them
+            edges - (u, v) index pairs in the order nx.read_gml(...).edges() yields them
+    '''
+    with open(folder_name + "/graph.gml", encoding="utf-8") as f:
+        tokens = _gml_token.findall(f.read())
+
+    ids, names, sources, targets = {}, [], [], []
+    depth = 0           # nesting depth below the current node/edge record
+    record = None       # "node", "edge" or None
+    fields = {}
+    key = None
+    for token in tokens:
+        if token == "[":
+            if record is None and depth == 1 and key in ("node", "edge"):
+                record, fields = key, {}
+            depth += 1
+            key = None
+        elif token == "]":
+            depth -= 1
+            if record is not None and depth == 1:
+                if record == "node":
+                    if fields["id"] in ids:
+                        raise ValueError("node id {} is duplicated".format(fields["id"]))
+                    ids[fields["id"]] = fields["label"]
+                    names.append(fields["label"])
+                else:
+                    sources.append(fields["source"])
+                    targets.append(fields["target"])
+                record = None
+        elif key is None:
+            key = token
+        else:
+            if depth == 1 and key in ("directed", "multigraph") and token != "0":
+                raise ValueError("only undirected simple graphs are supported")
+            if record is not None and depth == 2:
+                if key == "label":
+                    if token[0] == '"':
+                        token = token[1:-1]
+                        if "&" in token:
+                            from html import unescape
+                            token = unescape(token)
+                    fields[key] = token
+                elif key in ("id", "source", "target"):
+                    fields[key] = int(token)
+            key = None
+
+    index = {name: i for i, name in enumerate(names)}
+    if len(index) != len(names):
+        raise ValueError("node labels are not unique")
+
+    # NetworkX yields each node's neighbours in insertion order and skips
+    # neighbours that were already visited, so replay that on index lists
+    adjacency = [[] for _ in names]
+    seen = set()
+    for source, target in zip(sources, targets):
+        u, v = index[ids[source]], index[ids[target]]
+        if (u, v) in seen:
+            raise ValueError("edge ({}, {}) is duplicated".format(source, target))
+        seen.add((u, v))
+        seen.add((v, u))
+        adjacency[u].append(v)
+        if u != v:
+            adjacency[v].append(u)
+    edges = [(u, v) for u, nbrs in enumerate(adjacency) for v in nbrs if v >= u]
+    return names, edges
+
+def read_parameters(folder_name):
+    '''
+        Parses parameters.txt in an input folder
+
+        Outputs:
+            (num_buses, size_bus, constraints)
+            constraints - a list where each element is a list of student names forming a rowdy group
+    '''
+    with open(folder_name + "/parameters.txt") as parameters:
+        lines = parameters.read().splitlines()
+    num_buses = int(lines[0])
+    size_bus = int(lines[1])
+    # each constraint line looks like ['a', 'b', 'c']
+    constraints = [line[2:-2].split("', '") for line in lines[2:]]
+    return num_buses, size_bus, constraints
+
+# header: magic, byte-order mark, num_buses, size_bus, then the length of each array
+_magic = b"BUS1"
+_header = struct.Struct("=4sI3i9i")
+_arrays = ["name_offsets", "edge_u", "edge_v", "adj_offsets", "adj", "group_offsets",
+           "group_members", "student_group_offsets", "student_groups"]
+
+def instance_key(folder_name):
+    '''
+        Content hash of an input folder's graph.gml and parameters.txt
+    '''
+    import hashlib
+    h = hashlib.blake2b(digest_size=16)
+    for name in ("/graph.gml", "/parameters.txt"):
+        with open(folder_name + name, "rb") as f:
+            h.update(f.read())
+            h.update(b"\0")
+    return h.hexdigest()
+
+def write_compiled(instance, path):
+    '''
+        Writes an instance as a header, the int32 arrays back to back and a UTF-8 name table.
+        The file is written under a temporary name and renamed, so readers never see it half done.
+    '''
+    blob = bytearray()
+    name_offsets = array('i', [0])
+    for name in instance.names:
+        blob += name.encode("utf-8")
+        name_offsets.append(len(blob))
+    arrays = [name_offsets] + [getattr(instance, a) for a in _arrays[1:]]
+    header = _header.pack(_magic, 0x01020304, instance.num_buses, instance.size_bus,
+                          instance.self_loops, *[len(a) for a in arrays])
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for a in arrays:
+            f.write(a.tobytes() if isinstance(a, array) else bytes(a))
+        f.write(blob)
+    os.replace(tmp, path)
+
+def load_compiled(path):
+    '''
+        Maps a compiled instance into memory. The index arrays are int32 memoryviews
+        over the mapping, so nothing but the names is copied or decoded.
+    '''
+    import mmap
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    fields = _header.unpack_from(mm)
+    if fields[0] != _magic or fields[1] != 0x01020304:
+        raise ValueError("{} is not a compiled instance for this machine".format(path))
+    instance = ProblemInstance.__new__(ProblemInstance)
+    instance.num_buses, instance.size_bus, instance.self_loops = fields[2:5]
+    view = memoryview(mm)
+    offset = _header.size
+    for name, length in zip(_arrays, fields[5:]):
+        setattr(instance, name, view[offset:offset + 4 * length].cast('i'))
+        offset += 4 * length
+    blob = bytes(view[offset:])
+    bounds = instance.name_offsets
+    instance.names = [blob[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+    del instance.name_offsets
+    instance.index = {name: i for i, name in enumerate(instance.names)}
+    instance.path = path
+    instance.mmap = mm
+    return instance
+
+def compile_instance(folder_name, cache_dir=None):
+    '''
+        Parses an input folder and writes it to the cache unless an up to date copy exists
+
+        Outputs:
+            the path of the compiled instance
+    '''
+    # hashlib, mmap and html are imported where they are used, so importing this
+    # module (and the solver and scorer with it) stays cheap
+    import hashlib
+    cache_dir = cache_dir or path_to_cache
+    # Hashing a large graph.gml costs milliseconds, so remember the content key
+    # per folder alongside the files' sizes and mtimes and only rehash on change
+    stamp = " ".join(str(x) for name in ("/graph.gml", "/parameters.txt")
+                     for st in [os.stat(folder_name + name)] for x in (st.st_size, st.st_mtime_ns))
+    folder_key = hashlib.blake2b(os.path.abspath(folder_name).encode("utf-8"), digest_size=16).hexdigest()
+    stamp_path = cache_dir + "/" + folder_key + ".key"
+    key = None
+    if os.path.isfile(stamp_path):
+        with open(stamp_path) as f:
+            saved_stamp, _, saved_key = f.read().rpartition(" ")
+        if saved_stamp == stamp:
+            key = saved_key
+    if key is None:
+        key = instance_key(folder_name)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = "{}.{}.tmp".format(stamp_path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(stamp + " " + key)
+        os.replace(tmp, stamp_path)
+
+    path = cache_dir + "/" + key + ".bin"
+    if not os.path.isfile(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        write_compiled(parse_instance(folder_name), path)
+    return path
+
+def parse_instance(folder_name):
+    '''
+        Parses an input folder's text files into a ProblemInstance
+    '''
+    names, edges = read_graph(folder_name)
+    num_buses, size_bus, constraints = read_parameters(folder_name)
+    index = {name: i for i, name in enumerate(names)}
+    groups = [[index[s] for s in c] for c in constraints]
+    return ProblemInstance(names, edges, num_buses, size_bus, groups)
+
+def load_instance(folder_name, cache_dir=None):
+    '''
+        Loads an input folder as a ProblemInstance, going through the compiled cache
+        in path_to_cache (or cache_dir) when caching is enabled
+    '''
+    cache_dir = cache_dir or path_to_cache
+    if cache_dir is None:
+        return parse_instance(folder_name)
+    path = compile_instance(folder_name, cache_dir)
+    try:
+        return load_compiled(path)
+    except (ValueError, struct.error):
+        # stale format or foreign byte order: rebuild it
+        os.remove(path)
+        return load_compiled(compile_instance(folder_name, cache_dir))
+
+####################################################
+# To compile every input ahead of time:
+#   python3 instance.py <folder> [<folder> ...]
+#
+#   folder - an input folder, or a folder of input folders such as ../all_inputs/small
+####################################################
+if __name__ == '__main__':
+    for root in sys.argv[1:]:
+        if os.path.isfile(root + "/graph.gml"):
+            folders = [root]
+        else:
+            folders = sorted(root + "/" + name for name in os.listdir(root)
+                             if os.path.isfile(root + "/" + name + "/graph.gml")
+                             and os.path.isfile(root + "/" + name + "/parameters.txt"))
+        for folder in folders:
+            print(folder, compile_instance(folder))
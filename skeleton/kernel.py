@@ -0,0 +1,315 @@
+import random
+import solver
+from instance import as_numpy
+
+####################################################
+# Compiled inner loop for solver.anneal on the scorer's objective (get_score).
+# Needs Numba; without it `available` is False and solver.anneal keeps using the
+# pure-Python loop. Compiled code is cached next to this file, so only the
+# first run on a machine pays for compilation, but loading it still takes a
+# moment: see warm().
+####################################################
+try:
+    import numba
+    import numpy as np
+    available = True
+except ImportError:
+    numba = None
+    available = False
+
+def _jit(f):
+    return numba.njit(cache=True, nogil=True)(f) if available else f
+
+@_jit
+def _seed(seed):
+    np.random.seed(seed)
+
+@_jit
+def _group_delta(hist, spread, g, src, dst):
+    before = spread[g] == 1
+    after = spread[g] - (hist[g, src] == 1) + (hist[g, dst] == 0) == 1
+    return int(after) - int(before)
+
+@_jit
+def _in(values, lo, hi, x):
+    for i in range(lo, hi):
+        if values[i] == x:
+            return True
+    return False
+
+@_jit
+def _kept_delta(offsets, adj, loops_at, group_offsets, group_members, bus_of, intact,
+                moved, moved_to, flips, flip_d, change, mark, touched):
+    # solver's BusState._kept_delta over arrays: moved[i] goes to bus moved_to[i],
+    # flips[j] changes intact status by flip_d[j]; change, mark and touched are
+    # scratch space that is left zeroed
+    count = 0
+    for i in range(len(moved)):
+        s = moved[i]
+        mark[s] = 2 + i
+        touched[count] = s
+        count += 1
+    for j in range(len(flips)):
+        g = flips[j]
+        for p in range(group_offsets[g], group_offsets[g + 1]):
+            change[group_members[p]] += flip_d[j]
+    for j in range(len(flips)):
+        g = flips[j]
+        for p in range(group_offsets[g], group_offsets[g + 1]):
+            s = group_members[p]
+            if mark[s] == 0 and (intact[s] > 0) != (intact[s] + change[s] > 0):
+                mark[s] = 1
+                touched[count] = s
+                count += 1
+
+    d_kept = 0
+    for t in range(count):
+        s = touched[t]
+        old_s = bus_of[s]
+        new_s = moved_to[mark[s] - 2] if mark[s] >= 2 else old_s
+        keep_old = intact[s] == 0
+        keep_new = intact[s] + change[s] == 0
+        for p in range(offsets[s], offsets[s + 1]):
+            x = adj[p]
+            if mark[x] and x < s:
+                continue
+            old_x = bus_of[x]
+            new_x = moved_to[mark[x] - 2] if mark[x] >= 2 else old_x
+            before = keep_old and old_x == old_s and intact[x] == 0
+            after = keep_new and new_x == new_s and intact[x] + change[x] == 0
+            d_kept += int(after) - int(before)
+        d_kept += (int(keep_new) - int(keep_old)) * loops_at[s]
+
+    for t in range(count):
+        mark[touched[t]] = 0
+    for j in range(len(flips)):
+        g = flips[j]
+        for p in range(group_offsets[g], group_offsets[g + 1]):
+            change[group_members[p]] = 0
+    return d_kept
+
+@_jit
+def _move(student_group_offsets, student_groups, hist, spread, bus_of, s, dst):
+    # moves student s to bus dst in bus_of and the group histograms
+    src = bus_of[s]
+    for p in range(student_group_offsets[s], student_group_offsets[s + 1]):
+        g = student_groups[p]
+        hist[g, src] -= 1
+        if hist[g, src] == 0:
+            spread[g] -= 1
+        if hist[g, dst] == 0:
+            spread[g] += 1
+        hist[g, dst] += 1
+    bus_of[s] = dst
+
+@_jit
+def _steps(moves, T, relocate_rate, cap, kept, best,
+           offsets, adj, loops_at, group_offsets, group_members,
+           student_group_offsets, student_groups,
+           hist, spread, intact, bus_of, pos, members, size, best_bus,
+           change, mark, touched):
+    '''
+        Runs moves Metropolis moves at temperature T with solver.neighbors' move set,
+        maximising kept; returns (kept, best) and copies a new best into best_bus
+    '''
+    k = len(size)
+    moved = np.empty(2, dtype=np.int32)
+    moved_to = np.empty(2, dtype=np.int32)
+    flips = np.empty(len(student_groups) + 1, dtype=np.int32)
+    flip_d = np.empty(len(student_groups) + 1, dtype=np.int32)
+    for _ in range(moves):
+        one = np.random.randint(0, k)
+        two = np.random.randint(0, k)
+        while one == two:
+            two = np.random.randint(0, k)
+        a = members[one, np.random.randint(0, size[one])]
+        relocate = np.random.random() < relocate_rate and size[two] < cap and size[one] > 1
+        b = -1
+        if not relocate:
+            b = members[two, np.random.randint(0, size[two])]
+
+        # rowdy groups the move flips, skipping groups both swapped students are in
+        nflips = 0
+        for p in range(student_group_offsets[a], student_group_offsets[a + 1]):
+            g = student_groups[p]
+            if b >= 0 and _in(student_groups, student_group_offsets[b], student_group_offsets[b + 1], g):
+                continue
+            d = _group_delta(hist, spread, g, one, two)
+            if d != 0:
+                flips[nflips] = g
+                flip_d[nflips] = d
+                nflips += 1
+        if b >= 0:
+            for p in range(student_group_offsets[b], student_group_offsets[b + 1]):
+                g = student_groups[p]
+                if _in(student_groups, student_group_offsets[a], student_group_offsets[a + 1], g):
+                    continue
+                d = _group_delta(hist, spread, g, two, one)
+                if d != 0:
+                    flips[nflips] = g
+                    flip_d[nflips] = d
+                    nflips += 1
+
+        if nflips == 0:
+            d_kept = 0
+            for side in range(2 if b >= 0 else 1):
+                s = a if side == 0 else b
+                other = b if side == 0 else a
+                src = one if side == 0 else two
+                dst = two if side == 0 else one
+                if intact[s] != 0:
+                    continue
+                for p in range(offsets[s], offsets[s + 1]):
+                    x = adj[p]
+                    if x == other or intact[x] != 0:
+                        continue
+                    if bus_of[x] == src:
+                        d_kept -= 1
+                    elif bus_of[x] == dst:
+                        d_kept += 1
+        else:
+            moved[0] = a
+            moved_to[0] = two
+            count = 1
+            if b >= 0:
+                moved[1] = b
+                moved_to[1] = one
+                count = 2
+            d_kept = _kept_delta(offsets, adj, loops_at, group_offsets, group_members, bus_of,
+                                 intact, moved[:count], moved_to[:count], flips[:nflips],
+                                 flip_d[:nflips], change, mark, touched)
+
+        # the same test as solver.acceptance_probability(old, old - d_kept, T) > random()
+        if d_kept < 0 and np.exp(d_kept / T) <= np.random.random():
+            continue
+
+        _move(student_group_offsets, student_groups, hist, spread, bus_of, a, two)
+        if b >= 0:
+            _move(student_group_offsets, student_groups, hist, spread, bus_of, b, one)
+            pa, pb = pos[a], pos[b]
+            members[one, pa] = b
+            members[two, pb] = a
+            pos[a], pos[b] = pb, pa
+        else:
+            last = members[one, size[one] - 1]
+            members[one, pos[a]] = last
+            pos[last] = pos[a]
+            size[one] -= 1
+            members[two, size[two]] = a
+            pos[a] = size[two]
+            size[two] += 1
+        for j in range(nflips):
+            g = flips[j]
+            for p in range(group_offsets[g], group_offsets[g + 1]):
+                intact[group_members[p]] += flip_d[j]
+        kept += d_kept
+        if kept > best:
+            best = kept
+            best_bus[:] = bus_of
+    return kept, best
+
+class KernelState:
+    '''
+        The parts of a BusState the kernel needs, as flat int32 arrays. Only rowdy
+        groups that fit on one bus are kept; bigger ones can never be intact.
+    '''
+    def __init__(self, instance, state):
+        n, k, cap = instance.num_students, instance.num_buses, instance.size_bus
+        self.offsets = _readonly(as_numpy(instance.adj_offsets))
+        self.adj = _readonly(as_numpy(instance.adj))
+        self.loops_at = np.array(state.loops_at, dtype=np.int32)
+
+        small = [g for g, group in enumerate(state.groups) if len(group) <= cap]
+        renumber = {g: i for i, g in enumerate(small)}
+        self.group_offsets = np.zeros(len(small) + 1, dtype=np.int32)
+        self.group_offsets[1:] = np.cumsum([len(state.groups[g]) for g in small])
+        self.group_members = np.array([s for g in small for s in state.groups[g]], dtype=np.int32)
+        mine = [[renumber[g] for g in groups if g in renumber] for groups in state.groups_of]
+        self.student_group_offsets = np.zeros(n + 1, dtype=np.int32)
+        self.student_group_offsets[1:] = np.cumsum([len(m) for m in mine])
+        self.student_groups = np.array([g for m in mine for g in m], dtype=np.int32)
+
+        self.hist = np.zeros((len(small), k), dtype=np.int32)
+        for i, g in enumerate(small):
+            for b, c in state.hist[g].items():
+                self.hist[i, b] = c
+        self.spread = (self.hist > 0).sum(axis=1).astype(np.int32)
+        self.intact = np.array(state.intact, dtype=np.int32)
+        self.bus_of = np.array(state.bus_of, dtype=np.int32)
+        self.pos = np.array(state.pos, dtype=np.int32)
+        self.members = np.zeros((k, cap), dtype=np.int32)
+        self.size = np.zeros(k, dtype=np.int32)
+        for b, bus in enumerate(state.members):
+            self.members[b, :len(bus)] = bus
+            self.size[b] = len(bus)
+        self.best_bus = self.bus_of.copy()
+        self.change = np.zeros(n, dtype=np.int32)
+        self.mark = np.zeros(n, dtype=np.int32)
+        self.touched = np.zeros(n, dtype=np.int32)
+        self.kept = state.kept
+
+    def steps(self, moves, T, best):
+        self.kept, best = _steps(moves, T, solver.relocate_rate, self.members.shape[1], self.kept,
+                                 best, self.offsets, self.adj, self.loops_at, self.group_offsets,
+                                 self.group_members, self.student_group_offsets,
+                                 self.student_groups, self.hist, self.spread, self.intact,
+                                 self.bus_of, self.pos, self.members, self.size, self.best_bus,
+                                 self.change, self.mark, self.touched)
+        return best
+
+    def buses(self, bus_of):
+        buses = [[] for _ in range(len(self.size))]
+        for s, b in enumerate(bus_of.tolist()):
+            buses[b].append(s)
+        return buses
+
+def _readonly(values):
+    # whether a buffer is writable is part of the compiled signature, and a loaded
+    # instance's may be either, so the CSR arrays are always passed read-only
+    view = values.view()
+    view.flags.writeable = False
+    return view
+
+def ready():
+    '''
+        True once the kernel is compiled or loaded from the cache in this process
+    '''
+    return available and bool(_steps.signatures)
+
+def warm():
+    '''
+        Compiles the kernel, or loads it from the cache, by running one move on two
+        students with no friendships or groups on two buses of one seat each. The
+        first call in a process takes a second or more even with a cache.
+    '''
+    if not available or ready():
+        return
+    def ints(*values):
+        return np.array(values, dtype=np.int32)
+    offsets, adj = _readonly(ints(0, 0, 0)), _readonly(ints())
+    _seed(0)
+    _steps(1, 1.0, 0.5, 1, 0, 0, offsets, adj, ints(0, 0), ints(0), ints(), ints(0, 0, 0), ints(),
+           np.zeros((0, 2), dtype=np.int32), ints(), ints(0, 0), ints(0, 1), ints(0, 0),
+           ints(0, 1).reshape(2, 1), ints(1, 1), ints(0, 1), ints(0, 0), ints(0, 0), ints(0, 0))
+
+def kernel_anneal(instance, buses, deadline=None, stop=None, checkpoint=None, rng=random):
+    '''
+        solver.anneal on get_score with each temperature step's 500 moves run by the
+        compiled kernel under solver.run_schedule. The kernel's generator is seeded
+        from rng, so a seeded rng makes runs repeatable as on the Python path.
+    '''
+    from state import BusState
+    warm()
+    kernel = KernelState(instance, BusState(instance, buses))
+    _seed(rng.getrandbits(32))
+    best = kernel.kept
+
+    def step(T):
+        # run_schedule minimises, and the kernel maximises kept
+        nonlocal best
+        best = kernel.steps(500, T, best)
+        return -best
+
+    solver.run_schedule(step, -best, lambda: kernel.buses(kernel.best_bus), deadline, stop,
+                        checkpoint)
+    return kernel.buses(kernel.best_bus)
@@ -0,0 +1,61 @@
+class Swap:
+    '''
+        Exchanges the buses of students a and b.
+
+        A move is proposed, scored with delta() against a BusState, and only then
+        applied; undo() reverts an applied move. None of these copy the assignment.
+    '''
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+    def delta(self, state, kept=True):
+        '''
+            Outputs:
+                (d_friendships, d_rowdy, d_kept) - the change the move would make to the state's counters;
+                with kept=False d_kept may be None, as for state.swap_delta
+        '''
+        return state.swap_delta(self.a, self.b, kept)
+
+    def apply(self, state):
+        state.swap(self.a, self.b)
+
+    def undo(self, state):
+        # a swap is its own inverse
+        state.swap(self.a, self.b)
+
+    def students(self):
+        return (self.a, self.b)
+
+    def __repr__(self):
+        return "Swap({}, {})".format(self.a, self.b)
+
+class Relocate:
+    '''
+        Moves student s alone onto bus dst, changing the size of both buses.
+        Only valid when state.can_relocate(s, dst).
+    '''
+    __slots__ = ('s', 'dst', 'src')
+
+    def __init__(self, s, dst):
+        self.s = s
+        self.dst = dst
+        self.src = None
+
+    def delta(self, state, kept=True):
+        return state.relocate_delta(self.s, self.dst, kept)
+
+    def apply(self, state):
+        self.src = state.bus_of[self.s]
+        state.relocate(self.s, self.dst)
+
+    def undo(self, state):
+        state.relocate(self.s, self.src)
+
+    def students(self):
+        return (self.s,)
+
+    def __repr__(self):
+        return "Relocate({}, {})".format(self.s, self.dst)
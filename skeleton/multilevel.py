@@ -0,0 +1,285 @@
+import random
+import solver
+
+class Level:
+    '''
+        One graph in the coarsening hierarchy. Node u of the level stands for
+        weight[u] students; the finest level has one node per student.
+            adj - node -> {neighbour: number of friendships between them}
+            weight - node -> number of students in it
+            counts - node -> {rowdy group: number of its members in the node}
+            children - node -> the nodes of the next finer level it was made from
+    '''
+    def __init__(self, adj, weight, counts, children=None):
+        self.adj = adj
+        self.weight = weight
+        self.counts = counts
+        self.children = children
+
+    def __len__(self):
+        return len(self.adj)
+
+def finest_level(instance):
+    adj = [{} for _ in range(instance.num_students)]
+    for u, v in instance.edges():
+        if u != v:
+            adj[u][v] = adj[u].get(v, 0) + 1
+            adj[v][u] = adj[v].get(u, 0) + 1
+    counts = [{} for _ in range(instance.num_students)]
+    for g in range(instance.num_groups):
+        # a group bigger than a bus is never intact, so it constrains nothing
+        if len(instance.group(g)) > instance.size_bus:
+            continue
+        for s in instance.group(g):
+            counts[s][g] = counts[s].get(g, 0) + 1
+    return Level(adj, [1] * instance.num_students, counts)
+
+def can_merge(level, u, v, group_size, max_weight):
+    # a node rides one bus, so it must fit on a bus and never hold a whole rowdy group
+    if level.weight[u] + level.weight[v] > max_weight:
+        return False
+    cu, cv = level.counts[u], level.counts[v]
+    if len(cu) > len(cv):
+        cu, cv = cv, cu
+    return all(c + cv[g] < group_size[g] for g, c in cu.items() if g in cv)
+
+def coarsen(level, group_size, max_weight, rng=random):
+    '''
+        Heavy-edge matching: visits the nodes in random order and merges each unmatched
+        node with the unmatched neighbour it shares the most friendships with
+
+        Outputs:
+            the next coarser Level
+    '''
+    n = len(level)
+    match = [-1] * n
+    order = list(range(n))
+    rng.shuffle(order)
+    for u in order:
+        if match[u] != -1:
+            continue
+        best, best_w = u, 0
+        for v, w in level.adj[u].items():
+            if match[v] == -1 and w > best_w and can_merge(level, u, v, group_size, max_weight):
+                best, best_w = v, w
+        match[u] = best
+        match[best] = u
+
+    coarse = [-1] * n
+    children = []
+    for u in range(n):
+        if coarse[u] == -1:
+            coarse[u] = coarse[match[u]] = len(children)
+            children.append([u] if match[u] == u else [u, match[u]])
+
+    adj = [{} for _ in children]
+    weight = [0] * len(children)
+    counts = [{} for _ in children]
+    for u in range(n):
+        cu = coarse[u]
+        weight[cu] += level.weight[u]
+        for g, c in level.counts[u].items():
+            counts[cu][g] = counts[cu].get(g, 0) + c
+        for v, w in level.adj[u].items():
+            cv = coarse[v]
+            if cv != cu:
+                adj[cu][cv] = adj[cu].get(cv, 0) + w
+    return Level(adj, weight, counts, children)
+
+class Partition:
+    '''
+        An assignment of the nodes of a level to buses, with what refinement needs:
+            bus_of - node -> bus id, or -1 for a node split up by initial_partition
+            load - bus id -> number of students on it
+            size - bus id -> number of nodes on it
+            bus_counts - bus id -> {rowdy group: number of its members on the bus}
+        hidden lists (finer level, node, bus) for nodes placed below this level, which
+        take up room on their buses without being movable here.
+    '''
+    def __init__(self, level, num_buses, bus_of, hidden=()):
+        self.level = level
+        self.bus_of = bus_of
+        self.load = [0] * num_buses
+        self.size = [0] * num_buses
+        self.bus_counts = [{} for _ in range(num_buses)]
+        for u, b in enumerate(bus_of):
+            if b >= 0:
+                self._add(u, b)
+        for finer, u, b in hidden:
+            self.load[b] += finer.weight[u]
+            counts = self.bus_counts[b]
+            for g, c in finer.counts[u].items():
+                counts[g] = counts.get(g, 0) + c
+
+    def _add(self, u, b):
+        self.bus_of[u] = b
+        self.load[b] += self.level.weight[u]
+        self.size[b] += 1
+        counts = self.bus_counts[b]
+        for g, c in self.level.counts[u].items():
+            counts[g] = counts.get(g, 0) + c
+
+    def _remove(self, u):
+        b = self.bus_of[u]
+        self.load[b] -= self.level.weight[u]
+        self.size[b] -= 1
+        counts = self.bus_counts[b]
+        for g, c in self.level.counts[u].items():
+            counts[g] -= c
+
+    def move(self, u, b):
+        self._remove(u)
+        self._add(u, b)
+
+    def group_gain(self, u, dst, group_size, group_weight):
+        '''
+            Weight of the rowdy groups moving u to dst breaks, minus those it makes intact
+        '''
+        src = self.bus_of[u]
+        gain = 0
+        for g, c in self.level.counts[u].items():
+            if self.bus_counts[src][g] == group_size[g]:
+                gain += group_weight[g]
+            if self.bus_counts[dst].get(g, 0) + c == group_size[g]:
+                gain -= group_weight[g]
+        return gain
+
+def initial_partition(levels, num_buses, size_bus, group_size, group_weight):
+    '''
+        Greedy graph growing on the coarsest level: the num_buses heaviest nodes seed
+        the buses and every other node, heaviest first, joins the bus with room it
+        shares the most friendships with. A node that fits on no bus is split into
+        its children, down to single students if need be.
+
+        Outputs:
+            bus_of for the coarsest level, with -1 for nodes that were split up,
+            and {level index: bus_of assignments made to finer nodes}
+    '''
+    top = len(levels) - 1
+    coarsest = levels[top]
+    load = [0] * num_buses
+    bus_counts = [{} for _ in range(num_buses)]
+    placed = {k: {} for k in range(len(levels))}
+
+    def place(k, u, b):
+        placed[k][u] = b
+        load[b] += levels[k].weight[u]
+        for g, c in levels[k].counts[u].items():
+            bus_counts[b][g] = bus_counts[b].get(g, 0) + c
+
+    # (level, node) pairs still to place, heaviest last so they pop first
+    pending = sorted(((top, u) for u in range(len(coarsest))), key=lambda p: coarsest.weight[p[1]])
+    for b in range(num_buses):
+        place(*pending.pop(), b)
+
+    while pending:
+        k, u = pending.pop()
+        level = levels[k]
+        conn = {}
+        for v, w in level.adj[u].items():
+            if v in placed[k]:
+                conn[placed[k][v]] = conn.get(placed[k][v], 0) + w
+        best, best_key = None, None
+        for b in range(num_buses):
+            if load[b] + level.weight[u] > size_bus:
+                continue
+            intact = sum(group_weight[g] for g, c in level.counts[u].items()
+                         if bus_counts[b].get(g, 0) + c == group_size[g])
+            key = (conn.get(b, 0) - intact, -load[b])
+            if best_key is None or key > best_key:
+                best, best_key = b, key
+        if best is not None:
+            place(k, u, best)
+        else:
+            pending.extend((k - 1, c) for c in level.children[u])
+
+    bus_of = [placed[top].get(u, -1) for u in range(len(coarsest))]
+    return bus_of, placed
+
+def refine_level(partition, size_bus, group_size, group_weight, sweeps=4, rng=random):
+    '''
+        Greedy k-way refinement: moves boundary nodes to the bus they gain most on,
+        as long as it has room and the source bus keeps a node
+    '''
+    level, bus_of = partition.level, partition.bus_of
+    for _ in range(sweeps):
+        moved = 0
+        order = list(range(len(level)))
+        rng.shuffle(order)
+        for u in order:
+            src = bus_of[u]
+            if src < 0 or partition.size[src] == 1:
+                continue
+            conn = {}
+            for v, w in level.adj[u].items():
+                conn[bus_of[v]] = conn.get(bus_of[v], 0) + w
+            targets = conn
+            if any(partition.bus_counts[src][g] == group_size[g] for g in level.counts[u]):
+                # breaking up an intact group can pay off on a bus with no friends on it
+                targets = range(len(partition.load))
+            best, best_gain = src, 0
+            for b in targets:
+                if b == src or b < 0 or partition.load[b] + level.weight[u] > size_bus:
+                    continue
+                gain = conn.get(b, 0) - conn.get(src, 0) + partition.group_gain(u, b, group_size, group_weight)
+                if gain > best_gain:
+                    best, best_gain = b, gain
+            if best != src:
+                partition.move(u, best)
+                moved += 1
+        if not moved:
+            break
+
+def multilevel_partition(instance, coarsest=4, min_shrink=0.95, rng=random):
+    '''
+        METIS-style multilevel partitioning of the friendship graph into buses
+
+        Inputs:
+            instance - the ProblemInstance
+            coarsest - stop coarsening at this many nodes per bus
+            min_shrink - stop coarsening once a level keeps more than this fraction of nodes
+            rng - the generator matching and refinement orders are drawn from
+
+        Outputs:
+            a solution as lists of student indices, within size_bus and with no
+            rowdy group left intact that coarsening or refinement could avoid
+    '''
+    num_buses, size_bus = instance.num_buses, instance.size_bus
+    group_size = [len(instance.group(g)) for g in range(instance.num_groups)]
+    levels = [finest_level(instance)]
+    group_weight = [sum(len(levels[0].adj[s]) for s in instance.group(g))
+                    for g in range(instance.num_groups)]
+
+    while len(levels[-1]) > coarsest * num_buses:
+        level = coarsen(levels[-1], group_size, size_bus, rng)
+        if len(level) > min_shrink * len(levels[-1]):
+            break
+        levels.append(level)
+
+    bus_of, placed = initial_partition(levels, num_buses, size_bus, group_size, group_weight)
+    for k in range(len(levels) - 1, -1, -1):
+        # nodes split up during the initial partition were placed directly
+        for u, b in placed[k].items():
+            bus_of[u] = b
+        hidden = [(levels[j], u, b) for j in range(k) for u, b in placed[j].items()]
+        partition = Partition(levels[k], num_buses, bus_of, hidden)
+        refine_level(partition, size_bus, group_size, group_weight, rng=rng)
+        if k:
+            finer = [-1] * len(levels[k - 1])
+            for u, children in enumerate(levels[k].children):
+                if bus_of[u] != -1:
+                    for c in children:
+                        finer[c] = bus_of[u]
+            bus_of = finer
+
+    buses = [[] for _ in range(num_buses)]
+    for s, b in enumerate(bus_of):
+        buses[b].append(s)
+    return buses
+
+def multilevel_anneal(instance, deadline=None, checkpoint=None, rng=random):
+    '''
+        score_anneal started from multilevel_partition instead of greedy
+    '''
+    return solver.refine_anneal(instance, multilevel_partition(instance, rng=rng), deadline, checkpoint,
+                                rng=rng)
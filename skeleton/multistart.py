@@ -0,0 +1,109 @@
+import time
+import random
+import solver
+from community import community_seed
+from output_scorer import score_assignments
+
+# starting solutions a chain can be seeded from, each called as
+# starter(instance, rng, deadline); only the repair in greedy_with_constraint_check
+# is slow enough to need the deadline
+starters = {
+    "greedy": lambda instance, rng, deadline: solver.greedy(instance),
+    "generate_random": lambda instance, rng, deadline: solver.generate_random(instance, rng),
+    "greedy_with_constraint_check": solver.greedy_with_constraint_check,
+    "community_seed": lambda instance, rng, deadline: community_seed(instance, rng),
+}
+
+# per-chain best cost, shared with the worker processes for early kills
+_progress = None
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+    solver.warm_kernel()
+
+def run_chain(instance, chain, start, seed, deadline=None, kill_margin=None, engine=None,
+              checkpoint=None):
+    '''
+        Runs one chain: a starting solution annealed on the scorer's objective, or
+        with engine a run of that solver engine
+
+        Inputs:
+            instance - the ProblemInstance
+            chain - this chain's slot in the shared progress array
+            start - a key of starters
+            seed - seed for this chain's random generator
+            deadline - optional time.time() value to stop at
+            kill_margin - stop the chain early once its best is worse than the best
+                of all chains by more than this fraction of it; engines don't report
+                progress, so this only applies without engine
+            engine - optional name from solver.engine_names to run instead of annealing
+                from start
+            checkpoint - optional output path the chain writes its best solution to
+                whenever it is the best of all chains so far
+
+        Outputs:
+            (score, seed, start, solution) with the solution as lists of student indices
+    '''
+    rng = random.Random(seed)
+    names = instance.names
+
+    save = None
+    if checkpoint is not None:
+        def save(buses):
+            cost = solver.get_score(instance, buses)
+            if _progress is not None:
+                _progress[chain] = min(_progress[chain], cost)
+                if cost > min(_progress):
+                    return
+            solver.write_output(checkpoint, [[names[s] for s in bus] for bus in buses])
+
+    if engine is not None:
+        sol = solver.engine_function(engine)(instance, deadline, save, rng)
+        score, _ = score_assignments(instance, [[names[s] for s in bus] for bus in sol])
+        return score, seed, engine, sol
+
+    # the starting solution gets the same share of the chain as an FM stage
+    until = None if deadline is None else time.time() + solver.fm_share * (deadline - time.time())
+    sol = starters[start](instance, rng, until)
+    stop = None
+    if _progress is not None:
+        def stop(best):
+            _progress[chain] = best
+            leader = min(_progress)
+            return kill_margin is not None and best - leader > kill_margin * abs(leader)
+
+    sol = solver.anneal(instance, sol, solver.get_score, deadline, stop, save, rng)
+    score, _ = score_assignments(instance, [[names[s] for s in bus] for bus in sol])
+    return score, seed, start, sol
+
+def multi_start(instance, chains=4, jobs=None, deadline=None, seed=0, kill_margin=None,
+                engine=None, checkpoint=None):
+    '''
+        Runs independent annealing chains on a process pool and keeps the best one.
+        Chain k starts from the k-th starter (cycling through starters) with seed seed + k,
+        or with engine every chain runs that engine with its own seed.
+
+        Inputs:
+            instance - the ProblemInstance
+            chains - number of chains
+            jobs - number of worker processes, or None for one per core
+            deadline - optional time.time() value every chain stops at
+            seed - base seed
+            kill_margin - see run_chain; None never kills a chain
+            engine, checkpoint - see run_chain
+
+        Outputs:
+            the best solution found, as lists of student indices
+    '''
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    names = list(starters)
+    progress = multiprocessing.Array('d', [0.0] * chains, lock=False)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(progress,)) as pool:
+        futures = [pool.submit(run_chain, instance, k, names[k % len(names)], seed + k,
+                               deadline, kill_margin, engine, checkpoint)
+                   for k in range(chains)]
+        results = [future.result() for future in futures]
+    return max(results, key=lambda r: r[0])[3]
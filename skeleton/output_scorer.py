@@ -1,7 +1,5 @@
-import os
 import sys
-import networkx as nx
-import matplotlib.pyplot as plt
+from instance import as_numpy, load_instance
 
 ####################################################
 # To run:
@@ -26,24 +24,35 @@ def score_output(input_folder, output_file):
             score - a number between 0 and 1 which represents what fraction of friendships were broken
             msg - a string which stores error messages in case the output file is not valid for the given input
     '''
-    graph = nx.read_gml(input_folder + "/graph.gml")
-    parameters = open(input_folder + "/parameters.txt")
-    num_buses = int(parameters.readline())
-    size_bus = int(parameters.readline())
-    constraints = []
+    instance = load_instance(input_folder)
+    assignments = read_output(output_file)
+    return score_assignments(instance, assignments)
 
-    for line in parameters:
-        line = line[1: -2]
-        curr_constraint = [node.replace("'","") for node in line.split(", ")]
-        constraints.append(curr_constraint)
-
-    output = open(output_file)
+def read_output(output_file):
+    '''
+        Parses an output file into a list of buses, each a list of student names
+    '''
     assignments = []
-    for line in output:
-        line = line[1: -2]
-        curr_assignment = [node.replace("'","") for node in line.split(", ")]
-        assignments.append(curr_assignment)
+    with open(output_file) as output:
+        for line in output:
+            line = line[1: -2]
+            curr_assignment = [node.replace("'","") for node in line.split(", ")]
+            assignments.append(curr_assignment)
+    return assignments
+
+def score_assignments(instance, assignments):
+    '''
+        Scores a bus assignment against a ProblemInstance
 
+        Inputs:
+            instance - the ProblemInstance for the input
+            assignments - a list of buses, each a list of student names
+
+        Outputs:
+            (score, msg) as returned by score_output
+    '''
+    num_buses = instance.num_buses
+    size_bus = instance.size_bus
     if len(assignments) != num_buses:
         return -1, "Must assign students to exactly {} buses, found {} buses".format(num_buses, len(assignments))
     
@@ -54,44 +63,48 @@ def score_output(input_folder, output_file):
         if len(assignments[i]) <= 0:
             return -1, "Bus {} is empty".format(i)
         
-    bus_assignments = {}
-    attendance_count = 0
+    index = instance.index
+    bus_assignments = [-1] * instance.num_students
         
     # make sure each student is in exactly one bus
-    attendance = {student:False for student in graph.nodes()}
     for i in range(len(assignments)):
-        if not all([student in graph for student in assignments[i]]):
+        if not all([student in index for student in assignments[i]]):
             return -1, "Bus {} references a non-existant student: {}".format(i, assignments[i])
 
         for student in assignments[i]:
             # if a student appears more than once
-            if attendance[student] == True:
+            if bus_assignments[index[student]] != -1:
                 print(assignments[i])
                 return -1, "{0} appears more than once in the bus assignments".format(student)
                 
-            attendance[student] = True
-            bus_assignments[student] = i
+            bus_assignments[index[student]] = i
     
     # make sure each student is accounted for
-    if not all(attendance.values()):
+    if -1 in bus_assignments:
         return -1, "Not all students have been assigned a bus"
     
-    total_edges = graph.number_of_edges()
-    # Remove nodes for rowdy groups which were not broken up
-    for i in range(len(constraints)):
-        busses = set()
-        for student in constraints[i]:
-            busses.add(bus_assignments[student])
-        if len(busses) <= 1:
-            for student in constraints[i]:
-                if student in graph:
-                    graph.remove_node(student)
+    import numpy as np
+    total_edges = instance.num_edges
+    bus = np.array(bus_assignments, dtype=np.intc)
+
+    # A rowdy group is intact when the lowest and highest bus ids of its members
+    # agree; every member of an intact group is dropped along with their edges
+    offsets = as_numpy(instance.group_offsets)
+    members = as_numpy(instance.group_members)
+    sizes = np.diff(offsets)
+    nonempty = sizes > 0
+    removed = np.zeros(instance.num_students, dtype=bool)
+    if nonempty.any():
+        member_bus = bus[members]
+        starts = offsets[:-1][nonempty]
+        intact = np.minimum.reduceat(member_bus, starts) == np.maximum.reduceat(member_bus, starts)
+        removed[members[np.repeat(intact, sizes[nonempty])]] = True
 
     # score output
-    score = 0
-    for edge in graph.edges():
-        if bus_assignments[edge[0]] == bus_assignments[edge[1]]:
-            score += 1
+    u = as_numpy(instance.edge_u)
+    v = as_numpy(instance.edge_v)
+    kept = (bus[u] == bus[v]) & ~removed[u] & ~removed[v]
+    score = int(np.count_nonzero(kept))
     score = score / total_edges
 
 
@@ -0,0 +1,305 @@
+import time
+from array import array
+from state import BusState
+from moves import Swap, Relocate
+
+class GainBuckets:
+    '''
+        Students bucketed by the gain of their best move, as in Fiduccia-Mattheyses:
+        buckets[gain + offset] holds the students with that gain and top points at the
+        highest non-empty bucket, so the best student is found without a search.
+        Gains outside [-max_gain, max_gain] are clamped to the end buckets.
+    '''
+    def __init__(self, max_gain):
+        self.offset = max_gain
+        self.buckets = [None] * (2 * max_gain + 1)
+        self.gain_of = {}
+        self.top = -1
+
+    def __len__(self):
+        return len(self.gain_of)
+
+    def insert(self, s, gain):
+        i = min(max(gain + self.offset, 0), len(self.buckets) - 1)
+        if self.buckets[i] is None:
+            self.buckets[i] = {}
+        # dicts keep insertion order, so popitem() gives the usual LIFO tie-breaking
+        self.buckets[i][s] = None
+        self.gain_of[s] = gain
+        if i > self.top:
+            self.top = i
+
+    def remove(self, s):
+        gain = self.gain_of.pop(s)
+        i = min(max(gain + self.offset, 0), len(self.buckets) - 1)
+        del self.buckets[i][s]
+
+    def update(self, s, gain):
+        if s in self.gain_of:
+            self.remove(s)
+        self.insert(s, gain)
+
+    def pop(self):
+        '''
+            Removes and returns (student, gain) with the highest gain
+        '''
+        buckets = self.buckets
+        while not buckets[self.top]:
+            self.top -= 1
+        s, _ = buckets[self.top].popitem()
+        return s, self.gain_of.pop(s)
+
+def group_penalties(state):
+    '''
+        For each student, (group, penalty) pairs for the rowdy groups it is in. The
+        penalty for leaving a group intact is the number of friendships of its members,
+        which is what the scorer throws away while the group rides together. Groups
+        bigger than a bus can never be intact and are left out.
+    '''
+    size_bus = state.instance.size_bus
+    penalty = [sum(len(state.nbrs[s]) for s in group) if len(group) <= size_bus else 0
+               for group in state.groups]
+    return [[(g, penalty[g]) for g in groups if penalty[g]] for groups in state.groups_of]
+
+class GainTable:
+    '''
+        Per-(student, bus) move gains, kept up to date as moves are committed:
+            conn - conn[s][b] is the number of friends of s riding bus b
+            score - score[s][b] is conn[s][b] minus the penalty of every rowdy group
+                that s moving to b would make intact
+            leave - leave[s] is the penalty of every intact group s would break by leaving
+            room - the buses with a free seat
+        so relocating s from its bus src to dst gains leave[s] - conn[s][src] + score[s][dst].
+        A group only adds to these while it is intact or one member away from it, so
+        a move changes the movers' friends' rows at the two buses involved and the
+        group terms of the movers' own groups, and nothing else.
+    '''
+    def __init__(self, state, penalties):
+        self.state = state
+        self.penalties = penalties
+        k = len(state.members)
+        bus_of = state.bus_of
+        self.conn = []
+        for nbrs in state.nbrs:
+            row = array('i', [0]) * k
+            for x in nbrs:
+                row[bus_of[x]] += 1
+            self.conn.append(row)
+        self.score = [row[:] for row in self.conn]
+        size_bus = state.instance.size_bus
+        self.room = {b for b, bus in enumerate(state.members) if len(bus) < size_bus}
+        self.leave = array('i', [0]) * len(state.nbrs)
+        self.weight = {g: penalty for pairs in penalties for g, penalty in pairs}
+        for g in self.weight:
+            self._group(g, 1)
+
+    def _group(self, g, sign):
+        # adds (sign = 1) or removes (sign = -1) group g's terms; returns the students
+        # whose terms it touched
+        h = self.state.hist[g]
+        if len(h) > 2:
+            return ()
+        penalty = sign * self.weight[g]
+        group = self.state.groups[g]
+        if len(h) == 1:
+            # the same test as BusState._group_delta: a lone member can't break it
+            if len(group) < 2:
+                return ()
+            for s in group:
+                self.leave[s] += penalty
+            return group
+        one, two = h
+        bus_of = self.state.bus_of
+        touched = []
+        for s in group:
+            b = bus_of[s]
+            if h[b] == 1:
+                self.score[s][two if b == one else one] -= penalty
+                touched.append(s)
+        return touched
+
+    def gain(self, s, dst):
+        '''
+            Gain of relocating s to bus dst: friendships gained minus friendships lost,
+            plus the weight of every rowdy group broken minus every group made intact
+        '''
+        return self.leave[s] - self.conn[s][self.state.bus_of[s]] + self.score[s][dst]
+
+    def best_target(self, s):
+        '''
+            The bus s gains most by moving to, ignoring capacity
+
+            Outputs:
+                (gain, bus)
+        '''
+        src = self.state.bus_of[s]
+        row = self.score[s]
+        # max() over the array runs in C; src is masked out for the call
+        here, row[src] = row[src], -2**31
+        top = max(row)
+        row[src] = here
+        return self.leave[s] - self.conn[s][src] + top, row.index(top)
+
+    def commit(self, move, undo=False):
+        '''
+            Applies (or undoes) move and keeps the table in step, in O(degree of the
+            movers plus the size of their groups that are intact or nearly so)
+
+            Outputs:
+                the students whose gains changed
+        '''
+        state = self.state
+        movers = move.students()
+        before = [(s, state.bus_of[s]) for s in movers]
+        groups = {g for s in movers for g, _ in self.penalties[s]}
+        changed = set(movers)
+        for g in groups:
+            changed.update(self._group(g, -1))
+        if undo:
+            move.undo(state)
+        else:
+            move.apply(state)
+        for g in groups:
+            changed.update(self._group(g, 1))
+        conn, score = self.conn, self.score
+        size_bus = state.instance.size_bus
+        for s, src in before:
+            dst = state.bus_of[s]
+            for b in (src, dst):
+                if len(state.members[b]) < size_bus:
+                    self.room.add(b)
+                else:
+                    self.room.discard(b)
+            for x in state.nbrs[s]:
+                conn[x][src] -= 1
+                conn[x][dst] += 1
+                score[x][src] -= 1
+                score[x][dst] += 1
+                changed.add(x)
+        return changed
+
+def best_move(state, table, s, locked, swap_targets=3):
+    '''
+        The best legal move for s under size_bus: a relocation when the target bus
+        has room, otherwise a swap with the unlocked student on it whose move back
+        to s's bus gains most. Only the full buses among the swap_targets buses s
+        gains most by moving to are searched for a partner.
+
+        Outputs:
+            (gain, move), or (None, None) if s has no legal move
+    '''
+    src = state.bus_of[s]
+    members, room = state.members, table.room
+    leave, conn, score = table.leave, table.conn, table.score
+    row = score[s]
+    base = leave[s] - conn[s][src]
+    best = None, None
+    # src is masked out of s's row, as in best_target, while the buses are picked
+    masked = [(src, row[src])]
+    row[src] = -2**31
+    if len(members[src]) > 1 and room:
+        dst = max(room, key=row.__getitem__)
+        if dst != src:
+            best = base + row[dst], Relocate(s, dst)
+    # the swap_targets best buses by repeated max(), which runs in C, masking each
+    # one found; only a partial selection, never a sort of all the buses
+    full = []
+    for _ in range(min(swap_targets, len(members) - 1)):
+        top = max(row)
+        dst = row.index(top)
+        masked.append((dst, top))
+        row[dst] = -2**31
+        if dst not in room:
+            full.append(dst)
+    for dst, value in reversed(masked):
+        row[dst] = value
+    nbrs = set(state.nbrs[s])
+    for dst in full:
+        gain = base + row[dst]
+        for t in members[dst]:
+            if locked[t]:
+                continue
+            # the s-t friendship is counted as gained by both moves but stays split
+            pair = gain + leave[t] - conn[t][dst] + score[t][src] - 2 * (t in nbrs)
+            if best[0] is None or pair > best[0]:
+                best = pair, Swap(s, t)
+    return best
+
+def fm_pass(state, table, max_gain, patience=50, deadline=None):
+    '''
+        One Fiduccia-Mattheyses pass: repeatedly makes the best move of an unlocked
+        student and locks it, even when the move loses, then rolls back to the point
+        where the scorer's objective was highest. Stops early after patience moves
+        without a new best.
+
+        Outputs:
+            the improvement in state.kept
+    '''
+    n = state.instance.num_students
+    locked = bytearray(n)
+    buckets = GainBuckets(max_gain)
+    for s in range(n):
+        if s % 1024 == 0 and deadline is not None and time.time() >= deadline:
+            return 0
+        buckets.insert(s, table.best_target(s)[0])
+
+    start = best = state.kept
+    moves = []
+    best_len = 0
+    while buckets and len(moves) - best_len < patience:
+        if deadline is not None and time.time() >= deadline:
+            break
+        s, stored = buckets.pop()
+        gain, move = best_move(state, table, s, locked)
+        if move is None:
+            continue
+        if gain < stored:
+            # capacity or earlier moves made the stored gain stale; try it again later
+            buckets.insert(s, gain)
+            continue
+        changed = table.commit(move)
+        moves.append(move)
+        for m in move.students():
+            locked[m] = 1
+            if m in buckets.gain_of:
+                buckets.remove(m)
+        if state.kept > best:
+            best = state.kept
+            best_len = len(moves)
+
+        for x in changed:
+            if not locked[x]:
+                buckets.update(x, table.best_target(x)[0])
+
+    for move in reversed(moves[best_len:]):
+        table.commit(move, undo=True)
+    return best - start
+
+def fm_refine(instance, buses, passes=10, deadline=None):
+    '''
+        Improves a solution with Fiduccia-Mattheyses passes until one finds nothing
+
+        Inputs:
+            instance - the ProblemInstance
+            buses - a solution as lists of student indices, e.g. from greedy or anneal
+            passes - the most passes to run
+            deadline - optional time.time() value to stop at
+
+        Outputs:
+            the refined solution, as lists of student indices, never scoring worse
+    '''
+    if instance.num_buses < 2:
+        # nowhere to move anyone
+        return [list(bus) for bus in buses]
+    state = BusState(instance, buses)
+    penalties = group_penalties(state)
+    table = GainTable(state, penalties)
+    # a swap is two moves, so bound each student's gain twice over
+    max_gain = max([2 * (len(state.nbrs[s]) + sum(p for _, p in penalties[s]))
+                    for s in range(instance.num_students)] + [0])
+    for _ in range(passes):
+        if deadline is not None and time.time() >= deadline:
+            break
+        if fm_pass(state, table, max_gain, deadline=deadline) <= 0:
+            break
+    return [list(bus) for bus in state.members]
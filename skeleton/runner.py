@@ -0,0 +1,178 @@
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+from instance import load_instance
+from output_scorer import score_assignments
+from scorer_many import parse_ids, list_inputs
+import solver
+
+####################################################
+# To run:
+#   python3 runner.py <size> [<size> ...] [options]
+#
+#   size - an input size category under solver.path_to_inputs (small, medium or large)
+#
+# Options:
+#   --ids 18 221-331          only run these input ids (default: every input of each size)
+#   --jobs N                  number of worker processes (default: one per core)
+#   --budget 60               wall-clock seconds per instance, either one value for
+#   --budget small=2 large=60 every size or size=seconds pairs (default: no limit);
+#                             annealing cools at whatever rate uses up the budget
+#   --chains K                run K annealing chains per instance and keep the best
+#                             (each instance starts its own pool of chain workers,
+#                             so lower --jobs to match); with --engine every chain
+#                             runs that engine
+#   --kill-margin 0.05        with --chains and no --engine, stop a chain once its
+#                             best is more than this fraction behind the leader
+#   --engine tempering        solver engine, one of solver.engine_names (default: exact
+#                             for inputs of up to solver.exact_threshold students,
+#                             score otherwise)
+#   --seed 12345              seed every instance's run with this (default: a fresh
+#                             random seed per instance); the seed each output was
+#                             made with is recorded in the manifest
+#   --out DIR                 output root, outputs go to DIR/<size>/<id>.out
+#                             (default: solver.path_to_outputs)
+#   --manifest FILE           results manifest (default: DIR/manifest.csv)
+#
+# Examples:
+#   python3 runner.py small --ids 18
+#   python3 runner.py small medium large --budget small=2 medium=10 large=60
+#   python3 runner.py medium --ids 7 --seed 2817461  # replay a manifest row
+#
+# Every instance runs in its own worker task. Outputs are written atomically and
+# the manifest is rewritten after every finished instance, so an interrupted sweep
+# keeps everything that completed. Instances still running checkpoint their best
+# solution so far into their output file every solver.checkpoint_interval seconds.
+####################################################
+manifest_fields = ["size", "input", "status", "score", "seconds", "output", "seed"]
+
+def parse_budget(specs):
+    '''
+        Turns --budget arguments into {size: seconds}; the key None applies to every size
+    '''
+    budget = {}
+    for spec in specs or []:
+        if "=" in spec:
+            size, seconds = spec.split("=")
+            budget[size] = float(seconds)
+        else:
+            budget[None] = float(spec)
+    return budget
+
+def run_instance(size, i, input_folder, output_file, time_limit, options):
+    '''
+        Solves, writes and scores a single input; runs inside a worker process.
+        options are extra keyword arguments for solver.solve; without a seed among
+        them a fresh one is drawn, so the row records what the output came from.
+
+        Outputs:
+            a manifest row for the input
+    '''
+    start = time.time()
+    if options.get("seed") is None:
+        options = dict(options, seed=random.getrandbits(32))
+    row = {"size": size, "input": i, "output": output_file, "seed": options["seed"]}
+    try:
+        instance = load_instance(input_folder)
+        # the output file holds the best solution so far while the solver runs
+        solution = solver.solve(instance, time_limit=time_limit, checkpoint=output_file, **options)
+        solver.write_output(output_file, solution)
+        score, msg = score_assignments(instance, solution)
+        row["status"] = "ok" if score >= 0 else msg
+        row["score"] = score
+    except Exception as e:
+        row["status"] = "error: {!r}".format(e)
+        row["score"] = -1
+    row["seconds"] = round(time.time() - start, 3)
+    return row
+
+def read_manifest(manifest):
+    rows = {}
+    if os.path.isfile(manifest):
+        with open(manifest, newline="") as f:
+            for row in csv.DictReader(f):
+                rows[(row["size"], int(row["input"]))] = row
+    return rows
+
+def write_manifest(manifest, rows):
+    tmp = "{}.{}.tmp".format(manifest, os.getpid())
+    with open(tmp, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=manifest_fields)
+        writer.writeheader()
+        for key in sorted(rows):
+            writer.writerow(rows[key])
+    os.replace(tmp, manifest)
+
+def run(sizes, ids=None, jobs=None, budget=None, out=None, manifest=None, options=None):
+    '''
+        Solves every selected input across a process pool
+
+        Inputs:
+            sizes - a list of size categories
+            ids - a list of input ids to restrict to, or None for all
+            jobs - number of worker processes, or None for one per core
+            budget - {size: seconds} as returned by parse_budget
+            out - the output root folder
+            manifest - the manifest path, merged with any rows already in it
+            options - extra keyword arguments for solver.solve, such as chains, engine or seed
+
+        Outputs:
+            the manifest rows produced by this run
+    '''
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    budget = budget or {}
+    out = out or solver.path_to_outputs
+    manifest = manifest or out + "/manifest.csv"
+    rows = read_manifest(manifest)
+
+    tasks = []
+    for size in sizes:
+        os.makedirs(out + "/" + size, exist_ok=True)
+        for i, folder in list_inputs(size, ids, solver.path_to_inputs):
+            tasks.append((size, i, folder, out + "/" + size + "/" + str(i) + ".out",
+                          budget.get(size, budget.get(None)), options or {}))
+    # start the biggest inputs first so they don't straggle at the end
+    tasks.sort(key=lambda t: os.path.getsize(t[2] + "/graph.gml"), reverse=True)
+
+    done = []
+    # workers load anneal's compiled kernel before they take an input, not on its clock
+    with ProcessPoolExecutor(max_workers=jobs, initializer=solver.warm_kernel) as pool:
+        futures = [pool.submit(run_instance, *task) for task in tasks]
+        for future in as_completed(futures):
+            row = future.result()
+            print("{}/{}: {} {} ({}s)".format(row["size"], row["input"], row["status"],
+                                              row["score"], row["seconds"]))
+            done.append(row)
+            rows[(row["size"], row["input"])] = row
+            write_manifest(manifest, rows)
+    return done
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Solve many inputs in parallel")
+    parser.add_argument("sizes", nargs="+", choices=["small", "medium", "large"])
+    parser.add_argument("--ids", nargs="+")
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--budget", nargs="+")
+    parser.add_argument("--chains", type=int, default=1)
+    parser.add_argument("--engine", choices=solver.engine_names)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--kill-margin", type=float)
+    parser.add_argument("--out")
+    parser.add_argument("--manifest")
+    args = parser.parse_args(argv)
+    if args.kill_margin is not None and (args.chains < 2 or args.engine is not None):
+        parser.error("--kill-margin needs --chains above 1 and no --engine")
+
+    rows = run(args.sizes, parse_ids(args.ids) if args.ids else None, args.jobs,
+               parse_budget(args.budget), args.out, args.manifest,
+               {"chains": args.chains, "engine": args.engine, "seed": args.seed,
+                "kill_margin": args.kill_margin})
+    failed = [row for row in rows if row["status"] != "ok"]
+    print("{} solved, {} failed".format(len(rows) - len(failed), len(failed)))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,24 +1,133 @@
 import os
-avg = 0
-total = 0
-<<<<<<< HEAD
-inputs = [18]
-#inputs = [1, 6, 7, 9, 11] #, 12, 13, 18, 19, 20, 24, 26, 27, 29, 32, 34, 35, 36, 37, 42, 43, 44, 46, 47, 48, 49, 51, 52, 53, 56, 67, 68, 69, 71,73, 74, 76, 77, 81, 83, 84, 87, 88, 89, 90, 94, 95, 104, 108, 110]
-#inputs = [1, 3, 6, 7, 9, 11, 12, 13, 18, 20, 21, 24, 26, 27, 29, 30, 32, 34, 36, 37, 38, 40, 41, 43, 43, 45, 46, 47, 48, 49, 51, 52, 53, 54, 56, 59, 62, 63, 65, 67, 68, 69, 70, 71, 73, 74, 76, 77, 78, 81, 84, 83, 87, 88, 89, 90, 91, 95, 97, 100, 101, 102, 104, 105, 107, 108, 109, 110]
-for i in inputs:
-#for i in range(1000, 1034):
-	# if i in [106, 80, 39, 22]:
-	#  	continue
-	print(i)
-	os.system("python3 output_scorer.py ../all_inputs/small/" + str(i) + " new_small/" + str(i) + ".out")
-	os.system("python3 output_scorer.py ../all_inputs/small/" + str(i) + " bitbucket/" + str(i) + ".out")
-=======
-#inputs = [1000, 1009]
-#for i in inputs:
-for i in range(221, 332):
-	# if i in [139, 178, 162, 153, 142, 188]:
-	#  	continue
-	print(i)
-	os.system("python3 output_scorer.py ../all_inputs/medium/" + str(i) + " medium_final/" + str(i) + ".out")
-	os.system("python3 output_scorer.py ../all_inputs/medium/" + str(i) + " temp_medium/" + str(i) + ".out")
->>>>>>> 45701050228d56852a8ef78afe80c573290fbf7e
+import sys
+import csv
+import json
+import argparse
+from instance import load_instance
+from output_scorer import read_output, score_assignments
+
+####################################################
+# To run:
+#   python3 scorer_many.py <size> <candidate_dir> [<candidate_dir> ...] [options]
+#
+#   size - the input size category under ../all_inputs (small, medium or large)
+#   candidate_dir - a folder of <id>.out files to score
+#
+# Options:
+#   --ids 18 221-331   only score these input ids (default: every input of the size)
+#   --jobs N           number of worker processes (default: one per core)
+#   --csv FILE         write the score table as CSV
+#   --json FILE        write the score table as JSON
+#
+# Examples:
+#   python3 scorer_many.py small new_small bitbucket --ids 18
+#   python3 scorer_many.py medium medium_final temp_medium --ids 221-331 --csv medium.csv
+#
+# Each input is parsed once and every candidate for it is scored in the same
+# worker, instead of starting a fresh interpreter per (input, output) pair.
+####################################################
+path_to_inputs = "../all_inputs"
+
+def parse_ids(specs):
+    '''
+        Turns id arguments such as ["18", "221-331"] into a sorted list of ints
+    '''
+    ids = set()
+    for spec in specs:
+        if "-" in spec:
+            lo, hi = spec.split("-")
+            ids.update(range(int(lo), int(hi) + 1))
+        else:
+            ids.add(int(spec))
+    return sorted(ids)
+
+def list_inputs(size, ids=None, root=None):
+    '''
+        Returns (id, input_folder) pairs for a size category under root (default
+        path_to_inputs), skipping ids without an input
+    '''
+    category_path = (root or path_to_inputs) + "/" + size
+    if ids is None:
+        ids = sorted(int(name) for name in os.listdir(category_path) if name.isdigit())
+    inputs = []
+    for i in ids:
+        folder = category_path + "/" + str(i)
+        if os.path.isfile(folder + "/graph.gml") and os.path.isfile(folder + "/parameters.txt"):
+            inputs.append((i, folder))
+    return inputs
+
+def score_input(input_folder, output_files):
+    '''
+        Scores several candidate outputs against one input, loading the input once
+
+        Inputs:
+            input_folder - the path to the input folder
+            output_files - a list of paths to output files
+
+        Outputs:
+            a list of (output_file, score, msg), with score -1 for missing or invalid outputs
+    '''
+    instance = load_instance(input_folder)
+    results = []
+    for output_file in output_files:
+        if not os.path.isfile(output_file):
+            results.append((output_file, -1, "Output file not found"))
+            continue
+        score, msg = score_assignments(instance, read_output(output_file))
+        results.append((output_file, score, msg))
+    return results
+
+def score_many(inputs, candidates, jobs=None):
+    '''
+        Scores every candidate folder against every input across a process pool
+
+        Inputs:
+            inputs - (id, input_folder) pairs as returned by list_inputs
+            candidates - a list of folders holding <id>.out files
+            jobs - number of worker processes, or None for one per core
+
+        Outputs:
+            a list of rows {"input", "candidate", "score", "msg"} in input order
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(score_input, folder, [c + "/" + str(i) + ".out" for c in candidates])
+                   for i, folder in inputs]
+        for (i, folder), future in zip(inputs, futures):
+            for candidate, (_, score, msg) in zip(candidates, future.result()):
+                rows.append({"input": i, "candidate": candidate, "score": score, "msg": msg})
+    return rows
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Score folders of outputs against many inputs")
+    parser.add_argument("size")
+    parser.add_argument("candidates", nargs="+")
+    parser.add_argument("--ids", nargs="+")
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--csv")
+    parser.add_argument("--json")
+    args = parser.parse_args(argv)
+
+    inputs = list_inputs(args.size, parse_ids(args.ids) if args.ids else None)
+    rows = score_many(inputs, args.candidates, args.jobs)
+
+    for row in rows:
+        print("{}\t{}\t{}".format(row["input"], row["candidate"], row["score"]))
+    for candidate in args.candidates:
+        scores = [row["score"] for row in rows if row["candidate"] == candidate]
+        valid = [score for score in scores if score >= 0]
+        avg = sum(valid) / len(valid) if valid else 0
+        print("{}: {} valid of {}, average {}".format(candidate, len(valid), len(scores), avg))
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["input", "candidate", "score", "msg"])
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
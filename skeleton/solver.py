@@ -1,9 +1,11 @@
-import networkx as nx
 import os
+import sys
 import random
 import math
 import time
-import copy
+from instance import ProblemInstance, load_instance
+from state import BusState
+from moves import Swap, Relocate
 
 ###########################################
 # Change this variable to the path to
@@ -19,6 +21,28 @@ path_to_inputs = "../all_inputs"
 ###########################################
 path_to_outputs = "../outputs"
 
+# seconds between best-so-far checkpoints of a timed run
+checkpoint_interval = 5.0
+
+# fraction of proposed moves that try to relocate one student instead of swapping two
+relocate_rate = 0.5
+
+# fraction of proposed moves that targeted_neighbors aims at an intact rowdy group
+targeted_rate = 0.9
+
+# fraction of refine_anneal's remaining budget each FM stage may take
+fm_share = 0.1
+
+# run anneal's get_score loop in kernel.py's compiled kernel when Numba is installed.
+# Loading it takes a second or more, so runs with a deadline only use it once
+# warm_kernel() has run in the process; runner.py's workers call it up front.
+use_kernel = True
+
+# Everything that draws random numbers takes the run's generator as rng: a
+# random.Random, or by default the random module itself, which has the same methods.
+# solve(seed=...) makes one generator per run and passes it down, so a run with the
+# same seed and no time limit repeats exactly.
+
 def parse_input(folder_name):
     '''
         Parses an input and returns the corresponding graph and parameters
@@ -28,26 +52,448 @@ def parse_input(folder_name):
 
         Outputs:
             (graph, num_buses, size_bus, constraints)
-            graph - the graph as a NetworkX object
+            graph - the graph as a NetworkX object (GML attributes other than the labels are dropped)
             num_buses - an integer representing the number of buses you can allocate to
             size_buses - an integer representing the number of students that can fit on a bus
             constraints - a list where each element is a list vertices which represents a single rowdy group
     '''
-    graph = nx.read_gml(folder_name + "/graph.gml")
-    parameters = open(folder_name + "/parameters.txt")
-    num_buses = int(parameters.readline())
-    size_bus = int(parameters.readline())
-    constraints = []
+    # NetworkX is only needed by callers that want the graph object itself
+    import networkx as nx
+    instance = load_instance(folder_name)
+    names = instance.names
+    graph = nx.Graph()
+    graph.add_nodes_from(names)
+    graph.add_edges_from((names[u], names[v]) for u, v in instance.edges())
+    constraints = [[names[s] for s in instance.group(g)] for g in range(instance.num_groups)]
+    return graph, instance.num_buses, instance.size_bus, constraints
+
+def get_num_rowdy(instance, buses):
+    new_buses = [set(b) for b in buses]
+    num_rowdy_groups = 0
+    for g in range(instance.num_groups):
+        c = instance.group(g)
+        for b in new_buses:
+            if all(x in b for x in c):
+                num_rowdy_groups += 1
+                break
+    return num_rowdy_groups
+
+def get_num_friendships(instance, buses):
+    new_buses = [set(b) for b in buses]
+    num_friendships = 0
+    for edge in instance.edges():
+        for b in new_buses:
+            if edge[0] in b and edge[1] in b:
+                num_friendships += 1
+                break
+    return -1*num_friendships
+
+def get_score(instance, buses):
+    # the numerator of output_scorer's score: friendships kept among students
+    # who are not in a rowdy group that was left intact
+    bus_of = {s: i for i, b in enumerate(buses) for s in b}
+    removed = set()
+    for g in range(instance.num_groups):
+        c = instance.group(g)
+        if len({bus_of[x] for x in c}) <= 1:
+            removed.update(c)
+    num_kept = 0
+    for u, v in instance.edges():
+        if bus_of[u] == bus_of[v] and u not in removed and v not in removed:
+            num_kept += 1
+    return -1*num_kept
+
+def acceptance_probability(cost_old, cost_new, temp):
+    try:
+        exp = math.exp((cost_old - cost_new)/temp)
+    except OverflowError:
+        exp = 1.0
+    return exp
+
+def neighbors(state, num_buses, size_bus, rng=random):
+    busOne = rng.randint(0, num_buses - 1)
+    busTwo = rng.randint(0, num_buses - 1)
+    while busOne == busTwo:
+        busTwo = rng.randint(0, num_buses - 1)
+    #print(buses[busTwo])
+    sOne = rng.randint(0, len(state.members[busOne]) - 1)
+    # while sOne == sTwo:
+    #     sTwo = rng.randint(1, len(buses[busTwo]) - 1)
+    # move into spare capacity when there is some, so bus sizes aren't stuck at greedy's
+    if (rng.random() < relocate_rate and len(state.members[busTwo]) < size_bus
+            and len(state.members[busOne]) > 1):
+        return Relocate(state.members[busOne][sOne], busTwo)
+    sTwo = rng.randint(0, len(state.members[busTwo]) - 1)
+    return Swap(state.members[busOne][sOne], state.members[busTwo][sTwo])
+
+def targeted_neighbors(state, num_buses, size_bus, rng=random):
+    # move a member of an intact rowdy group off its bus; every such move breaks
+    # the group, where a uniform pick almost always lands on students in no group.
+    # Falls back to neighbors for the rest, and once every group is broken.
+    if not state.intact_groups or rng.random() >= targeted_rate:
+        return neighbors(state, num_buses, size_bus, rng)
+    group = state.groups[rng.choice(state.intact_groups)]
+    s = group[rng.randint(0, len(group) - 1)]
+    bus = rng.randint(0, num_buses - 2)
+    if bus >= state.bus_of[s]:
+        bus += 1
+    if rng.random() < relocate_rate and state.can_relocate(s, bus):
+        return Relocate(s, bus)
+    other = state.members[bus]
+    return Swap(s, other[rng.randint(0, len(other) - 1)])
+
+def cost_functions(state, cost):
+    '''
+        Maps cost (get_num_friendships, get_num_rowdy or get_score) onto a BusState
+
+        Outputs:
+            (delta, current)
+            delta - delta(move) is the change in cost the move would make
+            current - current() is the state's cost, equal to cost(instance, buses)
+    '''
+    # only get_score needs the exact change in kept, which is most of a delta's cost
+    if cost is get_num_rowdy:
+        def delta(move):
+            return move.delta(state, kept=False)[1]
+        def current():
+            return state.rowdy
+    elif cost is get_score:
+        def delta(move):
+            return -move.delta(state)[2]
+        def current():
+            return -state.kept
+    else:
+        def delta(move):
+            return -move.delta(state, kept=False)[0]
+        def current():
+            return -state.friendships
+    return delta, current
+
+def run_schedule(step, best, solution, deadline=None, stop=None, checkpoint=None):
+    '''
+        The cooling schedule every annealer shares: T falls geometrically from 1 to
+        T_min with one call of step(T) per temperature
+
+        Inputs:
+            step - step(T) makes one temperature step of moves at temperature T and
+                returns the best cost seen so far
+            best - the cost of the starting solution
+            solution - solution() returns the best solution so far, for checkpoint
+            deadline - optional time.time() value to finish by: the cooling rate is
+                re-fitted every step from the measured steps per second so that T
+                reaches T_min right at the deadline, however big the input is
+            stop - optional, called with the best cost once per step; the run ends
+                when it returns True
+            checkpoint - optional, called with solution() at most every
+                checkpoint_interval seconds while the best improves
+    '''
+    T = 1.0
+    T_min = 0.00001
+    alpha = 0.988
+    start = saved = time.time()
+    steps = 0
+    improved = False
+    while T > T_min:
+        now = time.time()
+        if deadline is not None:
+            if now >= deadline:
+                break
+            if steps:
+                steps_left = (deadline - now) * steps / (now - start)
+                alpha = (T_min / T) ** (1 / max(steps_left, 1))
+        if stop is not None and stop(best):
+            break
+        if checkpoint is not None and improved and now - saved >= checkpoint_interval:
+            checkpoint(solution())
+            saved = now
+            improved = False
+        new_best = step(T)
+        improved = improved or new_best < best
+        best = new_best
+        steps += 1
+        T = T*alpha
+
+def warm_kernel():
+    '''
+        Loads and compiles anneal's kernel if it will be used, outside of any time budget
+    '''
+    if use_kernel:
+        import kernel
+        kernel.warm()
+
+def compiled_kernel(deadline):
+    '''
+        The kernel module if anneal should use it, else None: never when use_kernel is
+        off or Numba is missing, and with a deadline only if it is already loaded
+    '''
+    if not use_kernel:
+        return None
+    if deadline is None:
+        import kernel
+    else:
+        kernel = sys.modules.get("kernel")
+        if kernel is None or not kernel.ready():
+            return None
+    return kernel if kernel.available else None
+
+def anneal(instance, buses, cost, deadline=None, stop=None, checkpoint=None, rng=random):
+    # cost is get_num_friendships, get_num_rowdy or get_score; moves are scored
+    # incrementally against the matching counter in the state, 500 per temperature
+    # step of run_schedule, which takes deadline, stop and checkpoint.
+    # rng is the generator moves are drawn from
+    if instance.num_buses < 2:
+        # every move needs two buses; neighbors would never find a second one
+        return [list(bus) for bus in buses]
+    if cost is get_score:
+        kernel = compiled_kernel(deadline)
+        if kernel is not None:
+            return kernel.kernel_anneal(instance, buses, deadline, stop, checkpoint, rng)
+    state = BusState(instance, buses)
+    delta, current = cost_functions(state, cost)
+    propose = targeted_neighbors if cost is get_num_rowdy else neighbors
+    num_buses, size_bus = instance.num_buses, instance.size_bus
+    old_cost = current()
+    best = old_cost
+    min_sol = state.snapshot()
+
+    def step(T):
+        nonlocal old_cost, best, min_sol
+        cost, low = old_cost, best
+        for _ in range(500):
+            # proposing never touches the state; only accepted moves are applied
+            move = propose(state, num_buses, size_bus, rng)
+            new_cost = cost + delta(move)
+            ap = acceptance_probability(cost, new_cost, T)
+            if ap > rng.random():
+                move.apply(state)
+                cost = new_cost
+                if new_cost < low:
+                    low = new_cost
+                    min_sol = state.snapshot()
+        old_cost, best = cost, low
+        return low
+
+    run_schedule(step, best, lambda: state.buses_from(min_sol), deadline, stop, checkpoint)
+    if current() < best:
+        return [list(bus) for bus in state.members]
+    return state.buses_from(min_sol)
+
+def edge_order(instance):
+    '''
+        Students in the order they first appear in the edge list, then the students
+        with no friends, in O(E + N)
+    '''
+    seen = bytearray(instance.num_students)
+    students = []
+    for u, v in instance.edges():
+        if not seen[u]:
+            seen[u] = 1
+            students.append(u)
+        if not seen[v]:
+            seen[v] = 1
+            students.append(v)
+    students.extend(s for s in range(instance.num_students) if not seen[s])
+    return students
+
+def chunk_buses(students, num_buses):
+    '''
+        Cuts an ordering of the students into num_buses equal runs and deals the
+        leftover students out one per bus
+    '''
+    initial_sol = [[] for _ in range(num_buses)]
+    x = 0
+    chunk = len(students)//num_buses
+    for i in range(num_buses):
+        initial_sol[i] = students[x:x+chunk]
+        x += chunk
+    i = 0
+    if x < len(students):
+        rest = students[x:]
+        for student in rest:
+            if i == num_buses:
+                i = 0
+            initial_sol[i] += [student]
+            i += 1
+    return initial_sol
+
+def repair_constraints(instance, buses, partners=8, deadline=None, rng=random):
+    '''
+        Breaks up intact rowdy groups one at a time. For each one it tries moving up to
+        partners of its members to every other bus, by relocation when the bus has room
+        and otherwise by swapping with up to partners students from it, and makes the move that
+        leaves the fewest groups intact and, among those, keeps the most friendships.
+        Groups no move helps are left for later passes, and passes repeat until a pass
+        breaks nothing.
+
+        Inputs:
+            instance - the ProblemInstance
+            buses - a solution as lists of student indices
+            partners - group members and swap partners sampled per bus
+            deadline - optional time.time() value to stop at
+            rng - the generator samples are drawn from
+
+        Outputs:
+            the repaired solution, as lists of student indices
+    '''
+    state = BusState(instance, buses)
+    num_buses = instance.num_buses
+    progress = True
+    while state.intact_groups and progress:
+        progress = False
+        # a group can be broken up by an earlier repair in the same pass
+        for g in list(state.intact_groups):
+            if deadline is not None and time.time() >= deadline:
+                return [list(bus) for bus in state.members]
+            if state.slot[g] < 0:
+                continue
+            group = state.groups[g]
+            if len(group) > partners:
+                group = rng.sample(group, partners)
+            best, best_key = None, (0, 0)
+            for s in group:
+                for b in range(num_buses):
+                    if b == state.bus_of[s]:
+                        continue
+                    # only friendships and intact groups count, so skip the exact kept delta
+                    if state.can_relocate(s, b):
+                        d_friendships, d_rowdy = state.relocate_delta(s, b, kept=False)[:2]
+                        if (d_rowdy, -d_friendships) < best_key:
+                            best, best_key = Relocate(s, b), (d_rowdy, -d_friendships)
+                        continue
+                    bus = state.members[b]
+                    for t in bus if len(bus) <= partners else rng.sample(bus, partners):
+                        d_friendships, d_rowdy = state.swap_delta(s, t, kept=False)[:2]
+                        if (d_rowdy, -d_friendships) < best_key:
+                            best, best_key = Swap(s, t), (d_rowdy, -d_friendships)
+            if best is not None and best_key[0] < 0:
+                best.apply(state)
+                progress = True
+    return [list(bus) for bus in state.members]
+
+def greedy_with_constraint_check(instance, rng=random, deadline=None):
+    return repair_constraints(instance, chunk_buses(edge_order(instance), instance.num_buses),
+                              deadline=deadline, rng=rng)
+
+def greedy(instance):
+    return chunk_buses(edge_order(instance), instance.num_buses)
+
+def greedy_anneal(instance, deadline=None, checkpoint=None, rng=random):
+    greedy_sol = greedy(instance)
+    # if get_num_rowdy(instance, greedy_sol) > 0:
+    #     final_sol = anneal(instance, greedy_sol, get_num_rowdy)
+    # else:
+    #     final_sol = anneal(instance, greedy_sol, get_num_friendships)
+    # give the friendship pass half of whatever time is left
+    halfway = None if deadline is None else (time.time() + deadline) / 2
+    final_sol = anneal(instance, greedy_sol, get_num_friendships, halfway, checkpoint=checkpoint, rng=rng)
+    final_sol = anneal(instance, final_sol, get_num_rowdy, deadline, checkpoint=checkpoint, rng=rng)
+    return final_sol
+
+def refine_anneal(instance, start, deadline=None, checkpoint=None, annealer=None, rng=random):
+    '''
+        Anneals a starting solution on the scorer's own objective, so breaking up rowdy
+        groups and keeping friendships are traded off against each other instead of
+        the rowdy pass undoing the friendship pass. FM passes take the start most of
+        the way, annealing escapes the local optimum they stop at, and a last FM pass
+        polishes the result. With a deadline each FM stage gets at most fm_share of
+        the time left, so dense inputs where FM is slow still get annealed.
+        annealer, if given, replaces anneal and is called as
+        annealer(instance, buses, deadline, checkpoint=checkpoint, rng=rng).
+    '''
+    from refine import fm_refine
+    share = None if deadline is None else time.time() + fm_share * (deadline - time.time())
+    start = fm_refine(instance, start, deadline=share)
+    until = None if deadline is None else time.time() + (1 - fm_share) * (deadline - time.time())
+    if annealer is None:
+        final_sol = anneal(instance, start, get_score, until, checkpoint=checkpoint, rng=rng)
+    else:
+        final_sol = annealer(instance, start, until, checkpoint=checkpoint, rng=rng)
+    return fm_refine(instance, final_sol, deadline=deadline)
 
-    for line in parameters:
-        line = line[1: -2]
-        curr_constraint = [num.replace("'", "") for num in line.split(", ")]
-        constraints.append(curr_constraint)
+def score_anneal(instance, deadline=None, checkpoint=None, rng=random):
+    return refine_anneal(instance, greedy(instance), deadline, checkpoint, rng=rng)
 
-    return graph, num_buses, size_bus, constraints
+def generate_random(instance, rng=random):
+    num_buses = instance.num_buses
+    students = list(range(instance.num_students))
+    rng.shuffle(students)
+    initial_sol = [[] for _ in range(num_buses)]
+    x = 0
+    for s in students:
+        if x == num_buses:
+            x = 0
+        initial_sol[x] += [s]
+        x += 1
+    return initial_sol
 
-def solve(graph, num_buses, size_bus, constraints):
-    #TODO: Write this method as you like. We'd recommend changing the arguments here as well
+def run_annealing(instance, deadline=None, checkpoint=None, rng=random):
+    random_sol = generate_random(instance, rng)
+    final_sol = anneal(instance, random_sol, get_num_friendships, deadline, checkpoint=checkpoint, rng=rng)
+    return final_sol
+
+# engines selectable through solve(engine=...); each is called as
+# engine(instance, deadline, checkpoint, rng) with checkpoint as for anneal
+engine_names = ["score", "anneal", "random_anneal", "tempering", "multilevel", "community", "exact",
+                "batch"]
+
+# solve() picks the exact engine by default for inputs with at most this many students
+exact_threshold = 50
+
+def engine_function(name):
+    if name == "tempering":
+        from tempering import greedy_tempering
+        return greedy_tempering
+    if name == "multilevel":
+        from multilevel import multilevel_anneal
+        return multilevel_anneal
+    if name == "community":
+        from community import community_anneal
+        return community_anneal
+    if name == "exact":
+        from exact import exact_anneal
+        return exact_anneal
+    if name == "batch":
+        from batch import batch_score_anneal
+        return batch_score_anneal
+    return {"score": score_anneal, "anneal": greedy_anneal, "random_anneal": run_annealing}[name]
+
+def solve(graph, num_buses=None, size_bus=None, constraints=None, time_limit=None, chains=1,
+          engine=None, checkpoint=None, seed=None, kill_margin=None):
+    '''
+        Solves an input and returns the bus assignment
+
+        Inputs:
+            either the (graph, num_buses, size_bus, constraints) values returned by parse_input,
+            or a single ProblemInstance as the first argument
+            time_limit - optional wall-clock budget in seconds; the cooling schedule is
+                stretched or shortened to finish when it is used up
+            chains - with more than one, run that many independent annealing chains
+                from different starts and seeds in parallel and keep the best; with
+                an engine, every chain runs that engine with its own seed
+            engine - one of engine_names: "score" for score_anneal, "anneal" for
+                greedy_anneal, "random_anneal" for run_annealing, "tempering" for
+                greedy_tempering, "multilevel" for multilevel_anneal, "community" for
+                community_anneal, "exact" for exact_anneal or "batch" for
+                batch_score_anneal. The default, None, is
+                "exact" for inputs of up to exact_threshold students and "score" otherwise,
+                or with chains, annealing each chain from multistart's starters
+            checkpoint - optional output path the best solution so far is written to
+                every checkpoint_interval seconds, so a killed run still leaves one;
+                with chains, by whichever chain is ahead
+            seed - seed for the run's random generator; None seeds it from the system.
+                Without a time_limit the same seed gives the same solution; with one,
+                how far the run gets still depends on the machine's speed
+            kill_margin - with chains and no engine, stop a chain once its best is worse
+                than the leading chain's by more than this fraction of it
+
+        Outputs:
+            a list of num_buses buses, each a list of student names
+    '''
+    if isinstance(graph, ProblemInstance):
+        instance = graph
+    else:
+        instance = ProblemInstance.from_graph(graph, num_buses, size_bus, constraints)
+    deadline = None if time_limit is None else time.time() + time_limit
     # num_constraints = len(constraints)
     # num_edges = len(graph.edges())
     # def cost(buses):
@@ -67,236 +513,37 @@ def solve(graph, num_buses, size_bus, constraints):
     #                 num_friendships += 1
     #                 break
     #     return 2*(num_friendships)/(.1 + num_edges) + num_satisfied_groups/(0.1 + num_constraints)
-    def get_num_rowdy(buses):
-        new_buses = [set(b) for b in buses]
-        num_rowdy_groups = 0
-        for c in constraints:
-            for b in new_buses:
-                if all(x in b for x in c):
-                    num_rowdy_groups += 1
-                    break
-        return num_rowdy_groups
-
-    def get_num_friendships(buses):
-        new_buses = [set(b) for b in buses]
-        num_friendships = 0
-        for edge in list(graph.edges):
-            for b in new_buses:
-                if edge[0] in b and edge[1] in b:
-                    num_friendships += 1
-                    break
-        return -1*num_friendships
-
-    def acceptance_probability(cost_old, cost_new, temp):
-        try:
-            exp = math.exp((cost_old - cost_new)/temp)
-        except OverflowError:
-            exp = 1.0
-        return exp
-
-    def neighbors(buses, num_buses, size_bus):
-        busOne = random.randint(0, num_buses - 1)
-        busTwo = random.randint(0, num_buses - 1)
-        while busOne == busTwo:
-            busTwo = random.randint(0, num_buses - 1)
-        #print(buses[busTwo])
-        sOne = random.randint(0, len(buses[busOne]) - 1)
-        sTwo = random.randint(0, len(buses[busTwo]) - 1)
-        # while sOne == sTwo:
-        #     sTwo = random.randint(1, len(buses[busTwo]) - 1)
-        temp = buses[busOne][sOne]
-        buses[busOne][sOne] = buses[busTwo][sTwo]
-        buses[busTwo][sTwo] = temp
-        return buses
-
-    def anneal(buses, cost):
-        old_cost = cost(buses)
-        best = cost(buses)
-        min_sol = buses
-        T = 1.0
-        T_min = 0.00001
-        alpha = 0.988
-        while T > T_min:
-            i = 1
-            # curr_time = time.time()
-            # if (curr_time - start)/60 >= 30.0:
-            #     break
-            while i <= 500:
-                new_buses = neighbors(buses, num_buses, size_bus)
-                new_cost = cost(new_buses)
-                if new_cost < best:
-                    best = new_cost
-                    min_sol = copy.deepcopy(new_buses)
-                ap = acceptance_probability(old_cost, new_cost, T)
-                if ap > random.random():
-                    buses = new_buses
-                    old_cost = new_cost
-                i += 1
-            T = T*alpha
-        if cost(buses) < best:
-            return buses
-        return min_sol
-
-    def greedy_with_constraint_check():
-	    students = []
-	    for e in graph.edges:
-	        if e[0] not in students:
-	            students.append(e[0].encode('ascii', 'ignore').decode("utf-8"))
-	        if e[1] not in students:
-	            students.append(e[1].encode('ascii', 'ignore').decode("utf-8"))
-	    for s in graph.nodes():
-	        if s not in students:
-	            students.append(s.encode('ascii', 'ignore').decode("utf-8"))
-	    initial_sol = [[] for _ in range(num_buses)]
-	    x = 0
-	    chunk = len(students)//num_buses
-	    for i in range(num_buses):
-	        initial_sol[i] = students[x:x+chunk]
-	        x += chunk
-	    i = 0 
-	    if x < len(students):   
-	        rest = students[x:]
-	        for student in rest: 
-	            if i == num_buses:
-	                i = 0
-	            initial_sol[i] += [student]
-	            i += 1
-	    cint = 0
-	    # counter = 0
-	    for c in constraints:
-	        for i in range(len(initial_sol)):
-	        	# while counter < 10 and cint < len(c):
-	            if all(x in initial_sol[i] for x in c):
-	                randbus = random.randint(0, len(initial_sol) - 1)
-	                randkid = random.randint(0, len(initial_sol[randbus]) - 1)
-	                cint = random.randint(0, len(c) - 1)
-	                temp = initial_sol[randbus][randkid]
-	                initial_sol[randbus][randkid] = c[cint]
-	                initial_sol[i].remove(c[cint])
-	                initial_sol[i].append(temp)
-		            #     cint += 1
-		            # counter += 1
-	    return initial_sol
-
-    def greedy():
-        students = []
-        edges = list(graph.edges())
-        #random.shuffle(edges)
-        for e in edges:
-            if e[0] not in students:
-                students.append(e[0].encode('ascii', 'ignore').decode("utf-8"))
-            if e[1] not in students:
-                students.append(e[1].encode('ascii', 'ignore').decode("utf-8"))
-        for s in graph.nodes():
-            if s not in students:
-                students.append(s.encode('ascii', 'ignore').decode("utf-8"))
-        initial_sol = [[] for _ in range(num_buses)]
-        x = 0
-        chunk = len(students)//num_buses
-        for i in range(num_buses):
-            initial_sol[i] = students[x:x+chunk]
-            x += chunk
-        i = 0 
-        if x < len(students):   
-            rest = students[x:]
-            for student in rest: 
-                if i == num_buses:
-                    i = 0
-                initial_sol[i] += [student]
-                i += 1
-        return initial_sol
-
-    def greedy_anneal():
-        greedy_sol = greedy()
-        # if get_num_rowdy(greedy_sol) > 0:
-        #     final_sol = anneal(greedy_sol, get_num_rowdy)
-        # else:
-        #     final_sol = anneal(greedy_sol, get_num_friendships)
-        final_sol = anneal(greedy_sol, get_num_friendships)
-        final_sol = anneal(final_sol, get_num_rowdy)
-        return final_sol
-
-    def generate_random():
-        students = list(graph.nodes())
-        random.shuffle(students)
-        initial_sol = [[] for _ in range(num_buses)]
-        x = 0
-        for s in students:
-            if x == num_buses:
-                x = 0
-            initial_sol[x] += [s.encode('ascii', 'ignore').decode("utf-8")]
-            x += 1
-        return initial_sol
-    def run_annealing():
-        random_sol = generate_random()
-        final_sol = anneal(random_sol)
-        finish = time.time()
-        return final_sol
-
-    #return greedy()
-    return greedy_anneal()
-    # return generate_random()
-    # return run_annealing()
-    # return greedy_with_constraint_check()
-
-# def main():
-#     '''
-#         Main method which iterates over all inputs and calls `solve` on each.
-#         The student should modify `solve` to return their solution and modify
-#         the portion which writes it to a file to make sure their output is
-#         formatted correctly.
-#     '''
-#     #size_categories = ["small", "medium", "large"]
-#     size_categories = ["medium"]
-#     if not os.path.isdir(path_to_outputs):
-#         os.mkdir(path_to_outputs)
-
-#     for size in size_categories:
-#         category_path = path_to_inputs + "/" + size
-#         output_category_path = path_to_outputs + "/" + size
-#         category_dir = os.fsencode(category_path)
-
-#         if not os.path.isdir(output_category_path):
-#             os.mkdir(output_category_path)
-
-#         for input_folder in os.listdir(category_dir):
-#             input_name = os.fsdecode(input_folder)
-#             if input_name == ".DS_Store": # or input_name in ["56", "21", "3"]:
-#                 continue
-#             graph, num_buses, size_bus, constraints = parse_input(category_path + "/" + input_name)
-#             solution = solve(graph, num_buses, size_bus, constraints)
-#             output_file = open(output_category_path + "/" + input_name + ".out", "w")
-
-#             #TODO: modify this to write your solution to your
-#             #      file properly as it might not be correct to
-#             #      just write the variable solution to a file
-#             with output_file as f:
-#                 for bus in solution:
-#                     f.write("%s\n" % bus)
-
-#             output_file.close()
-
-# if __name__ == '__main__':
-#     main()
-
-def test():
-    # 36
-    inputs = [18]
-    #inputs = [ 29, 32, 34, 35, 37, 42] #, 43, 44, 46, 47, 48, 49, 51, 52, 53, 56, 67, 68, 69, 71,73, 74, 76, 77, 81, 83, 84, 87, 88, 89, 90, 94, 95, 104, 108, 110]
-    #for i in range(1034, 1067):
-    for i in inputs:
-        # if i in [139, 178, 162, 153, 142, 188]:
-        #     continue
-        print(i)
-        input_folder = "../all_inputs/small/" + str(i)
-        start = time.time()
-        graph, num_buses, size_bus, constraints = parse_input(input_folder)
-        solution = solve(graph, num_buses, size_bus, constraints)
-        finish = time.time()
-        print((finish-start)/60.0)
-        output_file = "new_small/" + str(i) + ".out"
-        with open(output_file, "w") as f:
-            for bus in solution:
-                f.write("%s\n" % bus)
-        #print(solution)
-test()
+
+    save = None
+    if checkpoint is not None:
+        def save(buses):
+            write_output(checkpoint, [[instance.names[s] for s in bus] for bus in buses])
+
+    rng = random.Random(seed)
+    if chains > 1:
+        if engine is not None and kill_margin is not None:
+            raise ValueError("kill_margin only applies to chains run without an engine")
+        from multistart import multi_start
+        solution = multi_start(instance, chains, deadline=deadline, seed=rng.getrandbits(32),
+                               kill_margin=kill_margin, engine=engine, checkpoint=checkpoint)
+    else:
+        if engine is None:
+            engine = "exact" if instance.num_students <= exact_threshold else "score"
+        solution = engine_function(engine)(instance, deadline, save, rng)
+    return [[instance.names[s] for s in bus] for bus in solution]
+
+def write_output(output_file, solution):
+    '''
+        Writes a solution, one bus per line. The file is written under a temporary
+        name and renamed into place, so an interrupted run never leaves half an output.
+    '''
+    tmp = "{}.{}.tmp".format(output_file, os.getpid())
+    with open(tmp, "w") as f:
+        for bus in solution:
+            f.write("%s\n" % bus)
+    os.replace(tmp, output_file)
+
+if __name__ == '__main__':
+    # python3 solver.py takes the same arguments as runner.py
+    from runner import main
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,342 @@
+from array import array
+
+class BusState:
+    '''
+        Incremental cost state for a bus assignment, so that swapping two students
+        can be scored and committed without rescanning every edge and constraint.
+
+        Works on a ProblemInstance; buses are lists of student indices. The state keeps:
+            bus_of - student -> bus id
+            members - bus id -> list of students on that bus
+            pos - student -> index of the student in members[bus_of[student]]
+            same - student -> number of neighbours riding the same bus
+            hist - rowdy group -> {bus id: number of group members on that bus}
+            intact - student -> number of intact rowdy groups the student is in
+            intact_groups - the rowdy groups of two or more students currently entirely
+                on one bus, in no order; a one-student group is always intact and no
+                move can break it, so it is left out
+            slot - rowdy group -> its index in intact_groups, or -1
+            friendships - number of edges with both endpoints on the same bus
+            rowdy - number of rowdy groups entirely on one bus
+            kept - number of same-bus edges where neither student is in an intact
+                group, i.e. the numerator of output_scorer's score
+    '''
+    def __init__(self, instance, buses):
+        self.instance = instance
+        n = instance.num_students
+
+        # plain lists are the fastest thing to iterate in the hot loop
+        self.nbrs = [instance.neighbors(s).tolist() for s in range(n)]
+        self.groups = [instance.group(g).tolist() for g in range(instance.num_groups)]
+        self.groups_of = [instance.groups_of(s).tolist() for s in range(n)]
+        # self-loops are always on the same bus, so they only shift the totals
+        self.self_loops = instance.self_loops
+        self.loops_at = array('i', [0]) * n
+        for u, v in instance.edges():
+            if u == v:
+                self.loops_at[u] += 1
+
+        self.bus_of = array('i', [0]) * n
+        self.pos = array('i', [0]) * n
+        self.members = []
+        for b, bus in enumerate(buses):
+            students = list(bus)
+            for p, s in enumerate(students):
+                self.bus_of[s] = b
+                self.pos[s] = p
+            self.members.append(students)
+        self.recompute()
+
+    def recompute(self):
+        '''
+            Rebuilds every derived count from bus_of in O(E + sum of group sizes)
+        '''
+        bus_of = self.bus_of
+        self.same = array('i', [sum(1 for x in nbrs if bus_of[x] == bus_of[s])
+                                for s, nbrs in enumerate(self.nbrs)])
+        self.friendships = sum(self.same) // 2 + self.self_loops
+        self.hist = []
+        self.rowdy = 0
+        self.intact = array('i', [0]) * len(self.nbrs)
+        self.intact_groups = []
+        self.slot = array('i', [-1]) * len(self.groups)
+        for g, members in enumerate(self.groups):
+            h = {}
+            for s in members:
+                h[bus_of[s]] = h.get(bus_of[s], 0) + 1
+            self.hist.append(h)
+            if len(h) == 1:
+                self.rowdy += 1
+                if len(members) > 1:
+                    self._set_intact(g, 1)
+                for s in members:
+                    self.intact[s] += 1
+        intact = self.intact
+        self.kept = sum(self.loops_at[s] for s in range(len(intact)) if not intact[s])
+        self.kept += sum(1 for s, nbrs in enumerate(self.nbrs) if not intact[s]
+                         for x in nbrs if x > s and not intact[x] and bus_of[x] == bus_of[s])
+
+    def swap_delta(self, a, b, kept=True):
+        '''
+            Scores swapping students a and b without changing the state. With
+            kept=False the exact d_kept of a swap that flips a rowdy group is skipped,
+            which is most of the cost, and None is returned for it.
+
+            Outputs:
+                (d_friendships, d_rowdy, d_kept) - the change in friendships, intact
+                rowdy groups and friendships counted by the scorer
+        '''
+        return self._swap_delta(a, b, kept)[:3]
+
+    def _swap_delta(self, a, b, kept=True):
+        # with kept=False the exact d_kept of a move that flips groups is skipped
+        # and None is returned in its place
+        A, B = self.bus_of[a], self.bus_of[b]
+        if A == B:
+            return 0, 0, 0, ()
+
+        # rowdy groups that become intact (+1) or broken (-1)
+        flips = []
+        ga, gb = self.groups_of[a], self.groups_of[b]
+        if ga or gb:
+            shared = set(ga).intersection(gb)
+            for g in ga:
+                if g not in shared:
+                    d = self._group_delta(g, A, B)
+                    if d:
+                        flips.append((g, d))
+            for g in gb:
+                if g not in shared:
+                    d = self._group_delta(g, B, A)
+                    if d:
+                        flips.append((g, d))
+        d_rowdy = sum(d for _, d in flips)
+
+        # one pass over each neighbourhood counts friendships and kept friendships
+        bus_of, intact = self.bus_of, self.intact
+        d_friendships = d_kept = 0
+        for s, src, dst, other in ((a, A, B, b), (b, B, A, a)):
+            keep = not intact[s]
+            for x in self.nbrs[s]:
+                if x == other:
+                    continue
+                bx = bus_of[x]
+                if bx == src:
+                    d_friendships -= 1
+                    if keep and not intact[x]:
+                        d_kept -= 1
+                elif bx == dst:
+                    d_friendships += 1
+                    if keep and not intact[x]:
+                        d_kept += 1
+        if flips:
+            # students entering or leaving an intact group change which edges count
+            d_kept = self._kept_delta({a: B, b: A}, flips) if kept else None
+        return d_friendships, d_rowdy, d_kept, flips
+
+    def _kept_delta(self, moved, flips):
+        '''
+            Exact change in kept when the students in moved ({student: new bus}) move
+            and the groups in flips change intact status
+        '''
+        bus_of, intact = self.bus_of, self.intact
+        change = {}
+        for g, d in flips:
+            for s in self.groups[g]:
+                change[s] = change.get(s, 0) + d
+        # students whose bus or removed/kept status changes; every other edge is unaffected
+        touched = set(moved)
+        touched.update(s for s, d in change.items() if (intact[s] > 0) != (intact[s] + d > 0))
+
+        d_kept = 0
+        for s in touched:
+            old_s, new_s = bus_of[s], moved.get(s, bus_of[s])
+            keep_old = not intact[s]
+            keep_new = not intact[s] + change.get(s, 0)
+            for x in self.nbrs[s]:
+                if x in touched and x < s:
+                    continue
+                old_x = bus_of[x]
+                new_x = moved.get(x, old_x)
+                before = keep_old and old_x == old_s and not intact[x]
+                after = keep_new and new_x == new_s and not intact[x] + change.get(x, 0)
+                d_kept += after - before
+            d_kept += (keep_new - keep_old) * self.loops_at[s]
+        return d_kept
+
+    def _group_delta(self, g, src, dst):
+        h = self.hist[g]
+        before = len(h) == 1
+        after = len(h) - (h[src] == 1) + (dst not in h) == 1
+        return after - before
+
+    def swap(self, a, b):
+        '''
+            Commits swapping students a and b, updating every derived count.
+            Swapping the same pair again rolls the move back.
+        '''
+        A, B = self.bus_of[a], self.bus_of[b]
+        if A == B:
+            return
+        d_friendships, d_rowdy, d_kept, flips = self._swap_delta(a, b)
+
+        bus_of, same = self.bus_of, self.same
+        new_a = new_b = 0
+        for x in self.nbrs[a]:
+            if x == b:
+                continue
+            if bus_of[x] == A:
+                same[x] -= 1
+            elif bus_of[x] == B:
+                same[x] += 1
+                new_a += 1
+        for x in self.nbrs[b]:
+            if x == a:
+                continue
+            if bus_of[x] == B:
+                same[x] -= 1
+            elif bus_of[x] == A:
+                same[x] += 1
+                new_b += 1
+        same[a], same[b] = new_a, new_b
+
+        for g in self.groups_of[a]:
+            self._move_in_group(g, A, B)
+        for g in self.groups_of[b]:
+            self._move_in_group(g, B, A)
+        for g, d in flips:
+            self._set_intact(g, d)
+            for s in self.groups[g]:
+                self.intact[s] += d
+
+        pa, pb = self.pos[a], self.pos[b]
+        self.members[A][pa] = b
+        self.members[B][pb] = a
+        self.pos[a], self.pos[b] = pb, pa
+        bus_of[a], bus_of[b] = B, A
+        self.friendships += d_friendships
+        self.rowdy += d_rowdy
+        self.kept += d_kept
+
+    def relocate_delta(self, s, dst, kept=True):
+        '''
+            Scores moving student s alone onto bus dst without changing the state,
+            with kept as for swap_delta
+
+            Outputs:
+                (d_friendships, d_rowdy, d_kept) as for swap_delta
+        '''
+        return self._relocate_delta(s, dst, kept)[:3]
+
+    def _relocate_delta(self, s, dst, kept=True):
+        src = self.bus_of[s]
+        if src == dst:
+            return 0, 0, 0, ()
+
+        flips = []
+        for g in self.groups_of[s]:
+            d = self._group_delta(g, src, dst)
+            if d:
+                flips.append((g, d))
+        d_rowdy = sum(d for _, d in flips)
+
+        bus_of, intact = self.bus_of, self.intact
+        keep = not intact[s]
+        d_friendships = d_kept = 0
+        for x in self.nbrs[s]:
+            bx = bus_of[x]
+            if bx == src:
+                d_friendships -= 1
+                if keep and not intact[x]:
+                    d_kept -= 1
+            elif bx == dst:
+                d_friendships += 1
+                if keep and not intact[x]:
+                    d_kept += 1
+        if flips:
+            d_kept = self._kept_delta({s: dst}, flips) if kept else None
+        return d_friendships, d_rowdy, d_kept, flips
+
+    def can_relocate(self, s, dst):
+        '''
+            True if s can move to bus dst without overfilling it or emptying its own bus
+        '''
+        return (self.bus_of[s] != dst and len(self.members[dst]) < self.instance.size_bus
+                and len(self.members[self.bus_of[s]]) > 1)
+
+    def relocate(self, s, dst):
+        '''
+            Commits moving student s onto bus dst, updating every derived count.
+            Relocating s back to its old bus rolls the move back.
+        '''
+        src = self.bus_of[s]
+        if src == dst:
+            return
+        d_friendships, d_rowdy, d_kept, flips = self._relocate_delta(s, dst)
+
+        bus_of, same = self.bus_of, self.same
+        new_s = 0
+        for x in self.nbrs[s]:
+            if bus_of[x] == src:
+                same[x] -= 1
+            elif bus_of[x] == dst:
+                same[x] += 1
+                new_s += 1
+        same[s] = new_s
+
+        for g in self.groups_of[s]:
+            self._move_in_group(g, src, dst)
+        for g, d in flips:
+            self._set_intact(g, d)
+            for x in self.groups[g]:
+                self.intact[x] += d
+
+        # fill s's slot with the last student on its bus so removal is O(1)
+        old, p = self.members[src], self.pos[s]
+        last = old.pop()
+        if last != s:
+            old[p] = last
+            self.pos[last] = p
+        self.pos[s] = len(self.members[dst])
+        self.members[dst].append(s)
+        bus_of[s] = dst
+        self.friendships += d_friendships
+        self.rowdy += d_rowdy
+        self.kept += d_kept
+
+    def _set_intact(self, g, d):
+        # adds (d = 1) or removes (d = -1) g from intact_groups in O(1)
+        groups, slot = self.intact_groups, self.slot
+        if d > 0:
+            slot[g] = len(groups)
+            groups.append(g)
+        else:
+            last = groups.pop()
+            if last != g:
+                groups[slot[g]] = last
+                slot[last] = slot[g]
+            slot[g] = -1
+
+    def _move_in_group(self, g, src, dst):
+        h = self.hist[g]
+        if h[src] == 1:
+            del h[src]
+        else:
+            h[src] -= 1
+        h[dst] = h.get(dst, 0) + 1
+
+    def snapshot(self):
+        '''
+            Returns a copy of bus_of; slicing an array('i') is a single memcpy
+        '''
+        return self.bus_of[:]
+
+    def buses_from(self, snapshot):
+        '''
+            Turns a snapshot back into a list of buses of student indices
+        '''
+        buses = [[] for _ in self.members]
+        for s, b in enumerate(snapshot):
+            buses[b].append(s)
+        return buses
+
@@ -0,0 +1,96 @@
+import math
+import time
+import itertools
+import random
+import solver
+from state import BusState
+
+def temperature_ladder(replicas=12, T_max=1.0, T_min=0.001):
+    '''
+        Geometric ladder of temperatures from T_max (hottest) down to T_min
+    '''
+    if replicas == 1:
+        return [T_min]
+    return [T_max * (T_min / T_max) ** (k / (replicas - 1)) for k in range(replicas)]
+
+def parallel_tempering(instance, buses, cost, temps=None, sweeps=1000, moves=200, deadline=None,
+                       checkpoint=None, rng=random):
+    '''
+        Replica-exchange Monte Carlo: one BusState per temperature, all run as a batch in
+        this process. Each sweep makes `moves` Metropolis swap moves per replica, then
+        tries to exchange the states of neighbouring temperatures, alternating between
+        even and odd pairs. Hot replicas keep exploring while cold ones refine, so good
+        configurations found hot can still reach the bottom of the ladder.
+
+        Inputs:
+            instance - the ProblemInstance
+            buses - the starting solution, as lists of student indices
+            cost - get_num_friendships, get_num_rowdy or get_score, as for solver.anneal
+            temps - temperatures from hottest to coldest, default temperature_ladder()
+            sweeps - number of move/exchange rounds, or None to keep sweeping until the deadline
+            moves - moves per replica per sweep
+            deadline - optional time.time() value to stop at, checked between replicas
+            checkpoint - optional callable given the best solution so far, as for solver.anneal
+            rng - the generator moves and exchanges are drawn from
+
+        Outputs:
+            the lowest-cost solution seen by any replica, as lists of student indices
+    '''
+    if instance.num_buses < 2:
+        # every move needs two buses; neighbors would never find a second one
+        return [list(bus) for bus in buses]
+    temps = temps or temperature_ladder()
+    num_buses, size_bus = instance.num_buses, instance.size_bus
+    states = [BusState(instance, buses) for _ in temps]
+    views = [solver.cost_functions(state, cost) for state in states]
+    energies = [current() for _, current in views]
+    best = min(energies)
+    best_sol = states[energies.index(best)].snapshot()
+    saved = time.time()
+    improved = False
+
+    for sweep in itertools.count() if sweeps is None else range(sweeps):
+        now = time.time()
+        if deadline is not None and now >= deadline:
+            break
+        if checkpoint is not None and improved and now - saved >= solver.checkpoint_interval:
+            checkpoint(states[0].buses_from(best_sol))
+            saved = now
+            improved = False
+        for k, T in enumerate(temps):
+            # a sweep of every replica can take a good fraction of a second on large inputs
+            if deadline is not None and time.time() >= deadline:
+                break
+            state, (delta, _) = states[k], views[k]
+            e = energies[k]
+            for _ in range(moves):
+                move = solver.neighbors(state, num_buses, size_bus, rng)
+                new_e = e + delta(move)
+                if solver.acceptance_probability(e, new_e, T) > rng.random():
+                    move.apply(state)
+                    e = new_e
+                    if e < best:
+                        best = e
+                        best_sol = state.snapshot()
+                        improved = True
+            energies[k] = e
+
+        # exchange k and k + 1 with probability min(1, exp((E_k - E_k+1) * (1/T_k - 1/T_k+1)))
+        for k in range(sweep % 2, len(temps) - 1, 2):
+            x = (energies[k] - energies[k + 1]) * (1 / temps[k] - 1 / temps[k + 1])
+            if x >= 0 or math.exp(x) > rng.random():
+                states[k], states[k + 1] = states[k + 1], states[k]
+                views[k], views[k + 1] = views[k + 1], views[k]
+                energies[k], energies[k + 1] = energies[k + 1], energies[k]
+
+    return states[0].buses_from(best_sol)
+
+def greedy_tempering(instance, deadline=None, checkpoint=None, rng=random):
+    '''
+        score_anneal with the annealing done by parallel tempering; with a deadline
+        it sweeps until the deadline instead of for a fixed number of sweeps
+    '''
+    greedy_sol = solver.greedy(instance)
+    sweeps = 1000 if deadline is None else None
+    return parallel_tempering(instance, greedy_sol, solver.get_score, sweeps=sweeps,
+                              deadline=deadline, checkpoint=checkpoint, rng=rng)